@@ -1,8 +1,21 @@
 import os
 import sys
+import shutil
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import sub_runs
 
-exe = sys.argv[1] + 'long_term_tracking'
-os.system(exe + ' sim1.init')
-os.system(exe + ' sim2.init')
-os.system('cat sim1.dat sim2.dat > output.now')
-os.system('rm sim1.dat sim2.dat')
+# The two simulations are independent so run them at the same time. Each is run in its own directory with
+# its own copy of the lattice files since bmad_parser writes a digested file next to the lattice file.
+
+lat_files = ['lat.bmad', 'small_ring.bmad', 'ramp_1GeV.bmad']
+for sim in ['sim1', 'sim2']:
+  sub_runs.make_run_dir(sim, lat_files + [sim + '.init'])
+
+try:
+  exe = sub_runs.exe_path(sys.argv[1], 'long_term_tracking')
+  sub_runs.run_concurrent([sub_runs.sub_run_struct([exe, 'sim1.init'], 'sim1'),
+                           sub_runs.sub_run_struct([exe, 'sim2.init'], 'sim2')])
+  sub_runs.cat_files(['sim1/sim1.dat', 'sim2/sim2.dat'], 'output.now')
+finally:
+  for sim in ['sim1', 'sim2']:
+    shutil.rmtree(sim)
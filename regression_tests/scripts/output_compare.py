@@ -0,0 +1,277 @@
+#+
+# Comparison of a regression test "output.now" file to the "output.correct" file.
+#
+# Both files are parsed in one pass. The numeric (ABS, REL, VEC_REL) lines are then grouped by
+# tolerance type and the tolerances are checked with NumPy over all the data of a group at once.
+# Problems with the structure of the files (unparsable lines, ID or datum count mismatches, etc.)
+# do not stop the comparison. All failures and structural errors are reported, in file order.
+#
+# If NumPy is not available, the same checks are done line by line.
+#-
+
+import math
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+#----------------------------------------------------------
+# A failed line.
+# For STR lines, datum is the first datum that does not match and diff and diff_val are zero.
+# For numeric lines, datum is the datum with the largest difference that is out of tolerance.
+
+class failure_struct:
+  def __init__(self, ix_line, now_line, correct_line, id, tol_type, tol_str, now_data, correct_data):
+    self.ix_line = ix_line              # Index of the line pair in the files (blank and comment lines excluded).
+    self.now_line = now_line
+    self.correct_line = correct_line
+    self.id = id
+    self.tol_type = tol_type            # 'STR', 'ABS', 'REL', or 'VEC_REL'
+    self.tol_str = tol_str              # Tolerance as written in "output.now". '' for STR.
+    self.now_data = now_data
+    self.correct_data = correct_data
+    self.datum = 0                      # Index (0 based) of the bad datum.
+    self.diff = 0
+    self.diff_val = 0                   # diff / (average magnitude of the now and correct values)
+
+#----------------------------------------------------------
+# Structural problem with a line.
+# terminate is True for errors that are program flow failures (EG: a line that could not be compared or
+# an ID mismatch).
+
+class error_struct:
+  def __init__(self, ix_line, messages, terminate = True):
+    self.ix_line = ix_line
+    self.messages = messages
+    self.terminate = terminate
+
+#----------------------------------------------------------
+
+class compare_result_struct:
+  def __init__(self):
+    self.num_tests = 0                  # Number of lines compared.
+    self.num_failures = 0               # Number of failed lines. Includes failures not in the failures list.
+    self.failures = []                  # failure_struct list. Truncated to max_failures if max_failures > 0.
+    self.errors = []                    # error_struct list.
+
+  def events(self):
+    '''Failures and errors in file order.'''
+    return sorted(self.errors + self.failures, key = lambda ev: ev.ix_line)
+
+#----------------------------------------------------------
+# Return the list of data lines in a file. Blank lines and comment lines are skipped.
+
+def read_data_lines(file_name):
+  lines = []
+  with open(file_name, 'r') as f:
+    for line in f:
+      line = line.strip()
+      if len(line) == 0 or line[0] == '!': continue
+      lines.append(line)
+  return lines
+
+#----------------------------------------------------------
+# Numeric lines with the same tolerance type.
+
+class num_group_struct:
+  def __init__(self):
+    self.fails = []             # failure_struct for each line in the group.
+    self.tol_val = []
+
+#----------------------------------------------------------
+
+def to_float(str_list, bad_val):
+  vals = []
+  for s in str_list:
+    try:
+      vals.append(float(s))
+    except ValueError:
+      vals.append(bad_val)
+  return vals
+
+#----------------------------------------------------------
+# Check the tolerances of all lines in a group using NumPy.
+# Return list of (index of line in group, index of bad datum, diff, abs_val) for the failed lines.
+
+def check_group_numpy(group, tol_type):
+  n_data = np.array([len(fl.now_data) for fl in group.fails])
+  row = np.repeat(np.arange(len(n_data)), n_data)
+  start = np.concatenate(([0], np.cumsum(n_data)[:-1]))
+
+  now_str = [s for fl in group.fails for s in fl.now_data]
+  correct_str = [s for fl in group.fails for s in fl.correct_data]
+  try:
+    now_val = np.array(list(map(float, now_str)))
+  except ValueError:
+    now_val = np.array(to_float(now_str, 1e100))
+  correct_val = np.array(list(map(float, correct_str)))
+
+  diff = np.abs(now_val - correct_val)
+  abs_val = (np.abs(now_val) + np.abs(correct_val)) / 2
+  tol = np.array(group.tol_val)[row]
+
+  if tol_type == 'ABS':
+    bad = diff > tol
+  elif tol_type == 'REL':
+    bad = diff > abs_val * tol
+  else:   # VEC_REL
+    vec_amp = np.sqrt(np.bincount(row, weights = abs_val**2, minlength = len(n_data)))
+    bad = diff > vec_amp[row] * tol
+
+  if not bad.any(): return []
+
+  # For each row with a bad datum, find the bad datum with the largest diff.
+
+  bad_diff = np.where(bad, diff, -1.0)
+  row_max = np.maximum.reduceat(bad_diff, start)
+  is_max = bad & (bad_diff == row_max[row])
+  rows, ix_first = np.unique(row[is_max], return_index = True)
+  ix_el = np.nonzero(is_max)[0][ix_first]
+
+  return [(int(r), int(ix - start[r]), float(diff[ix]), float(abs_val[ix])) for r, ix in zip(rows, ix_el)]
+
+#----------------------------------------------------------
+# Same as check_group_numpy but line by line without NumPy.
+
+def check_group_python(group, tol_type):
+  bad_list = []
+  for r, (fl, tol_val) in enumerate(zip(group.fails, group.tol_val)):
+    now_val = to_float(fl.now_data, 1e100)
+    correct_val = [float(v) for v in fl.correct_data]
+    abs_val = [(abs(n) + abs(c)) / 2 for n, c in zip(now_val, correct_val)]
+    vec_amp = math.sqrt(sum(a**2 for a in abs_val))
+
+    bad_at = -1
+    bad_diff_val = 0
+    for ix, (n, c, a) in enumerate(zip(now_val, correct_val, abs_val)):
+      diff = abs(n - c)
+      factor = {'ABS': 1, 'REL': a, 'VEC_REL': vec_amp}[tol_type]
+      if diff > factor * tol_val and diff > bad_diff_val:
+        bad_at, bad_diff_val, bad_abs_val = ix, diff, a
+
+    if bad_at > -1: bad_list.append((r, bad_at, bad_diff_val, bad_abs_val))
+
+  return bad_list
+
+#----------------------------------------------------------
+# Compare "output.now" to "output.correct".
+# If max_failures > 0, at most max_failures failures are stored in the result. All failures are counted.
+
+def compare_files(now_file_name, correct_file_name, max_failures = 0):
+  res = compare_result_struct()
+  now_lines = read_data_lines(now_file_name)
+  correct_lines = read_data_lines(correct_file_name)
+  groups = {'ABS': num_group_struct(), 'REL': num_group_struct(), 'VEC_REL': num_group_struct()}
+  failures = []
+
+  n_lines = min(len(now_lines), len(correct_lines))
+  if len(now_lines) > n_lines:
+    res.errors.append(error_struct(n_lines, ['', '     Confusion! End of "output.correct" reached before End of "output.now"']))
+  if len(correct_lines) > n_lines:
+    res.errors.append(error_struct(n_lines, ['', '     Confusion! End of "output.now" reached before End of "output.correct"']))
+
+  for ix, (now_line, correct_line) in enumerate(zip(now_lines[:n_lines], correct_lines[:n_lines])):
+    now_split = now_line.split('"', 2)
+    correct_split = correct_line.split('"', 2)
+
+    if now_split[0] != '' or len(now_split) != 3:
+      res.errors.append(error_struct(ix, ['     Cannot parse line from "output.now": ' + now_line]))
+      continue
+
+    if correct_split[0] != '' or len(correct_split) != 3:
+      res.errors.append(error_struct(ix, ['     Cannot parse line from "output.correct": ' + correct_line]))
+      continue
+
+    if now_split[1] != correct_split[1]:
+      res.errors.append(error_struct(ix, ['     Identification string for a line in "output.now":    ' + now_split[1],
+                                          '     Does not match corresponding ID in "output.correct": ' + correct_split[1]]))
+
+    now_end = now_split[2].strip().split()
+    tol_type = now_end[0] if len(now_end) > 0 else ''
+
+    res.num_tests += 1
+
+    #----------------------------------------------
+    # String test
+
+    if tol_type == 'STR':
+      now2_split = now_split[2].split('"')
+      correct2_split = correct_split[2].split('"')[1:]
+
+      if len(now2_split) < 2:
+        res.errors.append(error_struct(ix, ['     Bad line line "output.now": ' + now_line]))
+        continue
+
+      now2_split.pop(0)    # Get rid of STR item.
+
+      if len(now2_split) != len(correct2_split):
+        res.errors.append(error_struct(ix, ['     Number of components in "output.now" line: ' + now_line,
+                                            '     Does not match number in "output.correct:  ' + correct_line]))
+        continue
+
+      for ixd, (now1, correct1) in enumerate(zip(now2_split, correct2_split)):
+        if now1 != correct1:
+          fl = failure_struct(ix, now_line, correct_line, now_split[1], 'STR', '', now2_split, correct2_split)
+          fl.datum = ixd
+          failures.append(fl)
+          break
+
+    #----------------------------------------------
+    # Real test. Lines are collected here and checked by group below.
+
+    elif tol_type in groups:
+      now2_split = now_split[2].strip().split()
+      correct2_split = correct_split[2].strip().split()[2:]   # [2:] -> Throw away EG: "ABS 2E-7"
+
+      if len(now2_split) < 3:
+        res.errors.append(error_struct(ix, ['     Bad line in "output.now": ' + now_line]))
+        continue
+
+      now2_split = now2_split[2:]
+
+      if len(now2_split) != len(correct2_split):
+        res.errors.append(error_struct(ix, ['     Number of components in "output.now" line: ' + now_line,
+                                            '     Does not match number in "output.correct:  ' + correct_line]))
+        continue
+
+      try:
+        tol_val = float(now_end[1])
+      except ValueError:
+        res.errors.append(error_struct(ix, ['     Bad tolerance in "output.now": ' + now_line]))
+        continue
+
+      group = groups[tol_type]
+      group.fails.append(failure_struct(ix, now_line, correct_line, now_split[1], tol_type, now_end[1], now2_split, correct2_split))
+      group.tol_val.append(tol_val)
+
+    #----------------------------------------------
+    # Error test
+
+    else:
+      res.errors.append(error_struct(ix, ['     Bad data ID string in "output.now" file: ' + now_line,
+                                          '     Should be one of: STR, REL, ABS, or VEC_REL.']))
+
+  #----------------------------------------------
+  # Check tolerances
+
+  for tol_type, group in groups.items():
+    if len(group.fails) == 0: continue
+    if np is None:
+      bad_list = check_group_python(group, tol_type)
+    else:
+      bad_list = check_group_numpy(group, tol_type)
+
+    for r, ixd, diff, abs_val in bad_list:
+      fl = group.fails[r]
+      fl.datum = ixd
+      fl.diff = diff
+      fl.diff_val = diff / abs_val
+      failures.append(fl)
+
+  failures.sort(key = lambda fl: fl.ix_line)
+  res.num_failures = len(failures)
+  if max_failures > 0: failures = failures[:max_failures]
+  res.failures = failures
+
+  return res
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+#+
+# Performance history for the regression tests.
+#
+# Each run of run_tests.py appends one line to a JSON-lines history file. The line holds the git
+# commit, host and bin directory of the run along with the wall time, CPU time and peak memory of
+# each test. The compare mode compares the latest run to a rolling baseline (the median of the
+# previous runs made on the same host with the same bin directory) and flags tests that have become
+# slower than a threshold.
+#
+# Usage:
+#   perf_history.py {-history <file>} {-threshold <frac>} {-baseline <n_runs>} {-min_time <sec>}
+#-
+
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+
+#----------------------------------------------------------
+# Commit hash of the checked out code. "unknown" if this is not a git checkout.
+
+def git_commit():
+  try:
+    proc = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout = subprocess.PIPE, stderr = subprocess.DEVNULL,
+                                              cwd = os.path.dirname(os.path.abspath(__file__)))
+    commit = proc.stdout.decode().strip()
+    if proc.returncode == 0 and commit != '': return commit
+  except OSError:
+    pass
+  return 'unknown'
+
+#----------------------------------------------------------
+# Append a run to the history file.
+# test_times is a dict of subdir -> dict with "wall", "cpu_user", "cpu_sys", and "max_rss" keys.
+
+def append_run(history_file, bin_dir, test_times):
+  run = {'commit':  git_commit(),
+         'date':    time.strftime('%Y-%m-%d %H:%M:%S'),
+         'host':    socket.gethostname(),
+         'bin_dir': bin_dir,
+         'tests':   test_times}
+
+  with open(history_file, 'a') as f:
+    f.write(json.dumps(run) + '\n')
+
+  return run
+
+#----------------------------------------------------------
+
+def read_history(history_file):
+  runs = []
+  if not os.path.isfile(history_file): return runs
+
+  with open(history_file, 'r') as f:
+    for line in f:
+      line = line.strip()
+      if line == '': continue
+      try:
+        runs.append(json.loads(line))
+      except ValueError:
+        print('Skipping bad line in history file: ' + history_file)
+
+  return runs
+
+#----------------------------------------------------------
+
+def median(vals):
+  vals = sorted(vals)
+  n = len(vals)
+  if n % 2 == 1: return vals[n//2]
+  return (vals[n//2-1] + vals[n//2]) / 2
+
+#----------------------------------------------------------
+# Compare the last run in runs to the baseline made from the previous n_baseline comparable runs.
+# Tests whose wall time is below min_time in both are ignored since their timing is mostly noise.
+# Return a list of [subdir, wall_now, wall_baseline, ratio] for tests where ratio > 1 + threshold.
+
+def find_slowdowns(runs, threshold = 0.25, n_baseline = 5, min_time = 1.0):
+  if len(runs) == 0: return []
+  now = runs[-1]
+
+  base_runs = [run for run in runs[:-1] if run['host'] == now['host'] and run['bin_dir'] == now['bin_dir']]
+  base_runs = base_runs[-n_baseline:]
+
+  slow = []
+  for subdir, now_t in now['tests'].items():
+    base_vals = [run['tests'][subdir]['wall'] for run in base_runs if subdir in run['tests']]
+    if len(base_vals) == 0: continue
+    base_wall = median(base_vals)
+    if max(base_wall, now_t['wall']) < min_time: continue
+    ratio = now_t['wall'] / max(base_wall, 1e-6)
+    if ratio > 1 + threshold: slow.append([subdir, now_t['wall'], base_wall, ratio])
+
+  return slow
+
+#----------------------------------------------------------
+# Return dict of subdir -> expected wall time of each test. This is the median time over the last
+# n_baseline runs made on this host with the same bin directory. If there are no such runs, the
+# runs made with any bin directory on this host, and then the runs on any host, are used.
+
+def expected_times(runs, bin_dir, n_baseline = 5):
+  host = socket.gethostname()
+  base_runs = [run for run in runs if run['host'] == host and run['bin_dir'] == bin_dir]
+  if len(base_runs) == 0: base_runs = [run for run in runs if run['host'] == host]
+  if len(base_runs) == 0: base_runs = runs
+
+  walls = {}
+  for run in base_runs:
+    for subdir, times in run['tests'].items():
+      walls.setdefault(subdir, []).append(times['wall'])
+
+  return dict((subdir, median(vals[-n_baseline:])) for subdir, vals in walls.items())
+
+#----------------------------------------------------------
+
+def print_help():
+  print('''
+Usage:
+   perf_history.py {-history <file>} {-threshold <frac>} {-baseline <n_runs>} {-min_time <sec>}
+Compares the last run in the history file to the previous runs.
+Defaults:
+   <file>     = "regression.history"
+   <frac>     = 0.25     ! Flag tests that are more than 25% slower than the baseline.
+   <n_runs>   = 5        ! Number of previous runs used for the baseline.
+   <sec>      = 1        ! Ignore tests whose run time is less than this.''')
+  exit()
+
+#----------------------------------------------------------
+# Main program.
+
+if __name__ == '__main__':
+  history_file = 'regression.history'
+  threshold = 0.25
+  n_baseline = 5
+  min_time = 1.0
+
+  i = 1
+  while i < len(sys.argv):
+    if sys.argv[i] == '-history':
+      history_file = sys.argv[i+1]
+    elif sys.argv[i] == '-threshold':
+      threshold = float(sys.argv[i+1])
+    elif sys.argv[i] == '-baseline':
+      n_baseline = int(sys.argv[i+1])
+    elif sys.argv[i] == '-min_time':
+      min_time = float(sys.argv[i+1])
+    else:
+      print_help()
+    i += 2
+
+  runs = read_history(history_file)
+  if len(runs) < 2:
+    print('Not enough runs in history file to compare: ' + history_file)
+    exit(0)
+
+  now = runs[-1]
+  print('Comparing run of commit ' + now['commit'][:12] + ' (' + now['date'] + ') to baseline.')
+
+  slow = find_slowdowns(runs, threshold, n_baseline, min_time)
+  for subdir, wall, base_wall, ratio in slow:
+    print('   Slowdown: %-32s %10.2f sec  (baseline %10.2f sec, x%.2f)' % (subdir, wall, base_wall, ratio))
+
+  if len(slow) == 0:
+    print('No slowdowns found.')
+    exit(0)
+  else:
+    exit(1)
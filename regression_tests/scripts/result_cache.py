@@ -0,0 +1,143 @@
+#+
+# Cache of regression test output.
+#
+# A test whose program and input files have not changed since an earlier run makes the same
+# "output.now" file. With the run_tests.py "-cache <cache_dir>" option, the output.now of each test
+# is saved in <cache_dir> under a key made from:
+#   The SHA-1 hash of the test program in the bin directory (for a test run with run.py, the programs
+#     in the bin directory named in run.py) and of the shared libraries in the lib directory next to it.
+#   The SHA-1 hash of each file in the test subdirectory except output.now.
+#   The environment variables that can change the output of a run (ACC_*, OMP_*, LD_LIBRARY_PATH, etc).
+# When a test has a saved output.now for its key, the program is not run. The saved output.now is
+# copied to the test subdirectory and compared to output.correct as usual.
+#
+# So files are not hashed every run, the hash of each file is saved along with its modification time and
+# size in <cache_dir>/file_hashes.json. Only the last max_entries outputs of a test are kept.
+#-
+
+import os
+import re
+import sys
+import glob
+import json
+import shutil
+import hashlib
+
+max_entries = 4
+
+env_prefixes = ('ACC_', 'OMP_', 'BMAD', 'TAO')
+env_names = ['LD_LIBRARY_PATH', 'DYLD_LIBRARY_PATH', 'PYTHONPATH']
+
+scripts_dir = os.path.dirname(os.path.abspath(__file__))
+
+#----------------------------------------------------------
+
+class result_cache_class:
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    self.hash_file = os.path.join(cache_dir, 'file_hashes.json')
+    self.hashes = {}          # Real path -> [mtime, size, sha]
+    try:
+      with open(self.hash_file) as f:
+        self.hashes = json.load(f)
+    except (OSError, ValueError):
+      pass
+
+  #----------------------------------------------------------
+  # SHA-1 hash of a file. The hash is only computed if the file has changed since it was last hashed.
+
+  def file_hash(self, file_name):
+    path = os.path.realpath(file_name)
+    stat = os.stat(path)
+    old = self.hashes.get(path)
+    if old is not None and old[0] == stat.st_mtime and old[1] == stat.st_size: return old[2]
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+      for block in iter(lambda: f.read(1 << 20), b''): sha.update(block)
+    self.hashes[path] = [stat.st_mtime, stat.st_size, sha.hexdigest()]
+    return sha.hexdigest()
+
+  #----------------------------------------------------------
+
+  def save_hashes(self):
+    os.makedirs(self.cache_dir, exist_ok = True)
+    with open(self.hash_file + '.tmp', 'w') as f:
+      json.dump(self.hashes, f)
+    os.replace(self.hash_file + '.tmp', self.hash_file)
+
+  #----------------------------------------------------------
+  # Return the cache key for the test in subdir. bin_dir is as passed to run_test.
+  # Return None if the test programs cannot be found. In this case the test is not cached.
+
+  def test_key(self, subdir, bin_dir):
+    if not os.path.isdir(subdir): return None
+    bin_dir = os.path.expandvars(bin_dir)
+    lines = []
+
+    # Programs
+
+    run_py = os.path.join(subdir, 'run.py')
+    if os.path.exists(run_py):
+      words = sorted(set(re.findall(r'\w+', open(run_py).read())))
+      programs = [os.path.join(subdir, bin_dir + word) for word in words if os.path.isfile(os.path.join(subdir, bin_dir + word))]
+      if len(programs) == 0: return None
+      programs += [os.path.join(scripts_dir, word + '.py') for word in words if os.path.isfile(os.path.join(scripts_dir, word + '.py'))]
+      lines.append('python ' + sys.version)
+    else:
+      programs = [os.path.join(subdir, bin_dir + subdir)]
+      if not os.path.isfile(programs[0]): return None
+
+    lib_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(programs[0]))), 'lib')
+    programs += sorted(glob.glob(os.path.join(lib_dir, '*.so*')) + glob.glob(os.path.join(lib_dir, '*.dylib')))
+
+    for program in programs:
+      lines.append('program ' + os.path.basename(program) + ' ' + self.file_hash(program))
+
+    # Input files
+
+    for file_dir, sub_dirs, files in os.walk(subdir):
+      sub_dirs[:] = sorted(sub_dir for sub_dir in sub_dirs if sub_dir[0] != '.')
+      for file_name in sorted(files):
+        if file_name[0] == '.': continue
+        if file_dir == subdir and file_name == 'output.now': continue
+        full_name = os.path.join(file_dir, file_name)
+        lines.append('input ' + os.path.relpath(full_name, subdir) + ' ' + self.file_hash(full_name))
+
+    # Environment
+
+    for name in sorted(os.environ):
+      if name.startswith(env_prefixes) or name in env_names: lines.append('env ' + name + '=' + os.environ[name])
+
+    return hashlib.sha1('\n'.join(lines).encode('utf-8', 'replace')).hexdigest()
+
+  #----------------------------------------------------------
+
+  def has_output(self, subdir, key):
+    return os.path.isfile(os.path.join(self.cache_dir, subdir, key + '.now'))
+
+  #----------------------------------------------------------
+  # Return the name of the saved output.now file of a test or None if there is none.
+
+  def cached_output(self, subdir, key):
+    file_name = os.path.join(self.cache_dir, subdir, key + '.now')
+    if not os.path.isfile(file_name): return None
+    os.utime(file_name)     # Mark as recently used.
+    return file_name
+
+  #----------------------------------------------------------
+  # Save the output.now file of a test. Older outputs of the test, beyond max_entries, are removed.
+
+  def save_output(self, subdir, key, now_file):
+    test_cache_dir = os.path.join(self.cache_dir, subdir)
+    os.makedirs(test_cache_dir, exist_ok = True)
+    file_name = os.path.join(test_cache_dir, key + '.now')
+    shutil.copyfile(now_file, file_name + '.tmp.' + str(os.getpid()))
+    os.replace(file_name + '.tmp.' + str(os.getpid()), file_name)
+
+    saved = sorted(glob.glob(os.path.join(test_cache_dir, '*.now')), key = os.path.getmtime, reverse = True)
+    for old_file in saved[max_entries:]:
+      try:
+        os.remove(old_file)
+      except OSError:
+        pass
@@ -0,0 +1,106 @@
+#+
+# Structured reports of regression test results.
+#
+# write_json writes a JSON file and write_junit writes a JUnit XML file. Both give, for each test
+# (regression subdirectory), the number of tests and failures, the grade, the timing, and for each
+# failed line the tolerance type, the worst datum, its Diff and Diff/Val.
+#-
+
+import time
+import json
+import xml.etree.ElementTree as ET
+
+#----------------------------------------------------------
+# Status of a test: 'passed', 'failed' (too many failed lines), or 'error' (flow failure).
+
+def test_status(res):
+  if len(res.flow_errors) > 0: return 'error'
+  if res.num_failures > res.max_fail: return 'failed'
+  return 'passed'
+
+#----------------------------------------------------------
+
+def failure_dict(fl):
+  return {'id':           fl.id,
+          'tol_type':     fl.tol_type,
+          'tolerance':    fl.tol_str,
+          'datum':        fl.datum + 1,
+          'now':          fl.now_data,
+          'correct':      fl.correct_data,
+          'diff':         fl.diff,
+          'diff_val':     fl.diff_val}
+
+#----------------------------------------------------------
+
+def test_dict(res):
+  failures = []
+  line_errors = []
+  num_lines = 0
+  if res.compare is not None:
+    failures = [failure_dict(fl) for fl in res.compare.failures]
+    line_errors = [' '.join(m.strip() for m in err.messages if m != '') for err in res.compare.errors]
+    num_lines = res.compare.num_tests
+
+  return {'name':           res.subdir,
+          'status':         test_status(res),
+          'num_tests':      num_lines,
+          'num_failures':   res.num_failures,
+          'max_fail':       res.max_fail,
+          'errors':         res.flow_errors,
+          'line_errors':    line_errors,          # Lines of output.now with structural errors (bad syntax, ID mismatch, etc).
+          'timed_out':      res.timed_out,
+          'cached':         res.cached,           # Program not run. Cached output.now used.
+          'wall_time':      res.duration,
+          'cpu_user':       res.cpu_user,
+          'cpu_sys':        res.cpu_sys,
+          'max_rss_mb':     res.max_rss,          # Upper bound. Includes the fork footprint of run_tests.py.
+          'failures':       failures}
+
+#----------------------------------------------------------
+# run_info is a dict of extra information about the run (bin directory, commit, etc).
+
+def write_json(file_name, results, run_info, duration):
+  report = dict(run_info)
+  report['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+  report['duration'] = duration
+  report['tests'] = [test_dict(res) for res in results]
+
+  with open(file_name, 'w') as f:
+    json.dump(report, f, indent = 1)
+
+#----------------------------------------------------------
+
+def write_junit(file_name, results, run_info, duration):
+  suites = ET.Element('testsuites')
+  suite = ET.SubElement(suites, 'testsuite', name = 'bmad_regression_tests', tests = str(len(results)),
+                        failures = str(len([res for res in results if test_status(res) == 'failed'])),
+                        errors = str(len([res for res in results if test_status(res) == 'error'])),
+                        time = '%.3f' % duration, timestamp = time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+  props = ET.SubElement(suite, 'properties')
+  for name, value in run_info.items():
+    ET.SubElement(props, 'property', name = name, value = str(value))
+
+  for res in results:
+    dat = test_dict(res)
+    case = ET.SubElement(suite, 'testcase', classname = 'regression_tests', name = res.subdir, time = '%.3f' % res.duration)
+
+    props = ET.SubElement(case, 'properties')
+    for name in ['num_tests', 'num_failures', 'max_fail', 'cpu_user', 'cpu_sys', 'max_rss_mb']:
+      ET.SubElement(props, 'property', name = name, value = str(dat[name]))
+
+    lines = []
+    for fl in dat['failures']:
+      lines.append('"%s" %s %s datum %d: now %s correct %s Diff: %s Diff/Val: %s' % (fl['id'], fl['tol_type'],
+                    fl['tolerance'], fl['datum'], fl['now'], fl['correct'], fl['diff'], fl['diff_val']))
+
+    if dat['status'] == 'error':
+      err = ET.SubElement(case, 'error', message = dat['errors'][0].strip())
+      err.text = '\n'.join(dat['errors'] + dat['line_errors'] + lines)
+    elif dat['status'] == 'failed':
+      fail = ET.SubElement(case, 'failure', message = '%d failed tests (maximum allowed %d)' % (res.num_failures, res.max_fail))
+      fail.text = '\n'.join(lines)
+
+  tree = ET.ElementTree(suites)
+  if hasattr(ET, 'indent'): ET.indent(tree)
+  tree.write(file_name, encoding = 'utf-8', xml_declaration = True)
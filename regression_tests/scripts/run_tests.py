@@ -8,7 +8,18 @@ import re
 import os
 import sys
 import time
-import math
+import signal
+import shutil
+import tempfile
+import subprocess
+from multiprocessing import Pool
+import perf_history
+import output_compare
+import test_select
+import result_report
+import result_cache
+import test_schedule
+import scratch_dir
 
 num_tests = 0
 num_failures = 0
@@ -31,324 +42,556 @@ def print_all(string, terminate = False, color = False, failing = False):
   else:
     print(string)
 
-  if terminate: 
+  if terminate:
     string2 = '     Flow Failure. Stopping here for this regression.'
     results.write(string2 + '\n')
     print(string2)
     global num_flow_failures
     num_flow_failures += 1
 
+#----------------------------------------------------------
+# Results from running the tests in one regression subdirectory.
+# When tests are run in parallel, the output lines are saved and printed later, in TESTS.LIST order,
+# with print_all. Otherwise (echo = True) lines are passed directly on to print_all.
+
+class test_result_struct:
+  def __init__(self, subdir = '', echo = False):
+    self.subdir = subdir
+    self.echo = echo
+    self.lines = []             # [string, terminate, color, failing]. terminate = None -> program output.
+    self.num_tests = 0
+    self.num_failures = 0
+    self.max_fail = 0
+    self.timeout = 0            # Seconds. 0 -> No timeout.
+    self.cores = 1              # Number of cores the test uses. Used when scheduling parallel runs.
+    self.timed_out = False
+    self.duration = 0           # Wall time.
+    self.cpu_user = 0
+    self.cpu_sys = 0
+    self.max_rss = 0            # Peak resident memory (MB). Upper bound. See run_program.
+    self.compare = None         # output_compare.compare_result_struct
+    self.flow_errors = []       # Messages for flow failures.
+    self.cached = False         # True if the program was not run and a cached output.now was used.
+
+  def print_all(self, string, terminate = False, color = False, failing = False):
+    if terminate: self.flow_errors.append(string.strip())
+    if self.echo:
+      print_all(string, terminate, color, failing)
+    else:
+      self.lines.append([string, terminate, color, failing])
+
+  def program_output(self, output):
+    self.lines.append([output, None, False, False])
+
+  def replay(self):
+    for string, terminate, color, failing in self.lines:
+      if terminate is None:
+        sys.stdout.write(string)
+      else:
+        print_all(string, terminate, color, failing)
+
 #----------------------------------------------------------
 def print_help():
   print('''
 Usage:
-   run_test.py {-bin <bin_dir>} {-debug} {-test <test_dir>} {-list <test_list_file>}
+   run_test.py {-bin <bin_dir>} {-debug} {-test <test_dir>} {-list <test_list_file>} {-j <num_jobs>}
+               {-timeout <sec>} {-history <history_file>} {-perf_check <frac>} {-max_failures <n>}
+               {-changed <git_ref>} {-json <json_file>} {-junit <xml_file>} {-cache <cache_dir>} {-no_cache}
+               {-scratch <scratch_dir>} {-results <results_file>}
 Note: Do not use -debug with -bin
 Defaults:
    <bin_dir>  = "../production/bin" ! Relative to current directory.
               = "../debug/bin"      ! If -debug switch is present
    <test_dir> = ""                  ! For running a single test. Overrides test.list list.
-   <test_list_file> = "test.list"   ! For running multiple tests.''')
+   <test_list_file> = "test.list"   ! For running multiple tests.
+   <num_jobs> = 1                   ! Number of tests (cores) to run in parallel. Longest tests are started first.
+                                    ! Tests using more than one core are marked with "cores=<n>" in TESTS.LIST.
+   <sec>      = 0                   ! Time limit for each test. 0 -> No limit.
+                                    ! Can be set per test with "timeout=<sec>" in TESTS.LIST.
+   <history_file> = "regression.history" ! Test timings are appended here. "" -> No history.
+   <frac>     = 0                   ! If non-zero, tests more than this fraction slower than the
+                                    !   baseline from the history file count as failures.
+   <n>        = 0                   ! Maximum number of failures printed per test. 0 -> No limit.
+   <git_ref>  = ""                  ! If set, only run tests affected by changes relative to <git_ref> (EG: HEAD).
+   <json_file> = ""                 ! If set, write results in JSON format to this file.
+   <xml_file>  = ""                 ! If set, write results in JUnit XML format to this file.
+   <cache_dir> = ""                 ! If set, output.now files are cached here and a test whose program and
+                                    !   input files are unchanged is not rerun. See scripts/result_cache.py.
+   -no_cache                        ! Run all tests even if there is a cached output. The cache is still updated.
+   <scratch_dir> = ""               ! If set, tests are run in a per-run directory in <scratch_dir> instead of in the
+                                    !   test subdirectories. See scripts/scratch_dir.py.
+   <results_file> = "regression.results" ! Results file.''')
   exit()
 
 #----------------------------------------------------------
-# List of tests is in "test.list".
+# Compare the output of the program "output.now" to the expected output "output.correct"
+# All failures are printed, up to max_failures (if non-zero). All failures are counted.
+
+def compare_output(res, now_file_name, correct_file_name, max_failures = 0):
+  comp = output_compare.compare_files(now_file_name, correct_file_name, max_failures)
+  res.num_tests += comp.num_tests
+  res.num_failures += comp.num_failures
+  res.compare = comp
+
+  for ev in comp.events():
+    if isinstance(ev, output_compare.error_struct):
+      for message in ev.messages:
+        res.print_all (message, False, True, True)
+      continue
 
-results = open('regression.results', 'w')
+    res.print_all ('')
+    if ev.tol_type == 'STR':
+      if len(ev.now_data) == 2:     # Will always have blank item in list.
+        res.print_all ('     Regression test failed:', color = True)
+      else:
+        res.print_all ('     Regression test failed for datum number: ' + str(ev.datum+1), color = True)
+      res.print_all ('          Line from "output.now": ' + ev.now_line, color = True)
+      res.print_all ('          Line from "output.correct": ' + ev.correct_line, color = True)
+    else:
+      res.print_all ('     Regression test failed for: "' + ev.id + '"   ' + ev.tol_type + '   ' + ev.tol_str, color = True)
+      if len(ev.now_data) != 1:
+        res.print_all ('     Regression test failed for datum number: ' + str(ev.datum+1), color = True)
+      res.print_all ('        Data from "output.now":     ' + str(ev.now_data), color = True)
+      res.print_all ('        Data from "output.correct": ' + str(ev.correct_data), color = True)
+      res.print_all ('        Diff: ' + str(ev.diff) + '  Diff/Val: ' + str(ev.diff_val), color = True)
 
-bin_dir = '../production/bin/'
-test_dir_list = []
-test_list_file = 'TESTS.LIST'
-time0 = time.time()
+  if len(comp.failures) < comp.num_failures:
+    res.print_all ('')
+    res.print_all ('     Number of failures not shown: ' + str(comp.num_failures - len(comp.failures)), color = True)
 
-i = 1
-while i < len(sys.argv):
-  if sys.argv[i] == '-bin':
-    bin_dir = sys.argv[i+1]
-    i += 1
-  elif sys.argv[i] == '-test':
-    test_dir_list = [sys.argv[i+1]]
-    i += 1
-  elif sys.argv[i] == '-list':
-    test_list_file = [sys.argv[i+1]]
-    i += 1
-  elif sys.argv[i] == '-debug':
-    bin_dir = '../debug/bin'
-  else:
-    print_help()
+  n_bad = len([err for err in comp.errors if err.terminate])
+  if n_bad > 0:
+    res.print_all ('')
+    res.print_all ('     Number of lines with structural errors: ' + str(n_bad), True, True, True)
 
-  i += 1
+  res.print_all ('')
 
-if bin_dir[0] != '/' and bin_dir[0] != '$': bin_dir = '../' + bin_dir
-if bin_dir[-1] != '/': bin_dir = bin_dir + '/'
-if len(test_dir_list) == 1 and test_dir_list[0] == 'all': test_dir_list = []
+#----------------------------------------------------------
 
-if len(test_dir_list) == 0:
-  dir_file = open (test_list_file, 'r')
-  test_dir_list = dir_file.readlines()
+def print_resources(res):
+  res.print_all ('     Duration of test (sec): ' + str(res.duration))
+  res.print_all ('     CPU time user/sys (sec): %.2f / %.2f' % (res.cpu_user, res.cpu_sys))
+  res.print_all ('     Peak memory (MB, upper bound): %.1f' % res.max_rss)
 
-#-------------------------------------------------------------
+#----------------------------------------------------------
+# Run a command in subdirectory subdir and wait for it to finish or for the timeout.
+# os.wait4 is used so the resource usage (user/sys CPU time and peak RSS) is that of this command
+# and the processes it waited on. The command is run in its own process group so that on a timeout
+# any programs started by a run.py script are killed along with it.
+# Return: (timed_out, rusage, output). output is None if capture is False.
+
+def run_command(command, subdir, timeout, capture):
+  out_file = tempfile.TemporaryFile() if capture else None
+  proc = subprocess.Popen(command, shell = True, cwd = subdir, start_new_session = True,
+                                                      stdout = out_file, stderr = subprocess.STDOUT if capture else None)
+  time0 = time.time()
+  timed_out = False
 
-for test_dir in test_dir_list:
-  time0_test = time.time()
-  test_dir = test_dir.strip()
-  ix = test_dir.find('!')
-  if ix != -1: test_dir = test_dir[:ix]
-  if len(test_dir) == 0: continue
+  while True:
+    pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+    if pid != 0: break
+    if timeout > 0 and time.time() - time0 > timeout:
+      timed_out = True
+      os.killpg(proc.pid, signal.SIGKILL)
+      pid, status, rusage = os.wait4(proc.pid, 0)
+      break
+    time.sleep(0.05)
 
-  # Is this a note:
+  proc.returncode = os.waitstatus_to_exitcode(status)   # So Popen does not try to reap the process again.
 
-  if test_dir[:5] == 'NOTE:':
-    print_all ('Note in TESTS.LIST file: ' + test_dir, False, True, False)
-    continue
+  output = None
+  if capture:
+    out_file.seek(0)
+    output = out_file.read().decode('utf-8', 'replace')
+    out_file.close()
 
-  #-----------------------------------------------------------
-  # Run the programs
+  return timed_out, rusage, output
 
-  dir_split = test_dir.split()
-  num_programs += 1
-  num_local_tests = 0
-  num_local_failures = 0
+#----------------------------------------------------------
+# Run the program, or run.py script, of the test in subdir. The program is run in work_dir.
+# time0_test is the start time of the test. Return False if there is a flow failure.
+
+def run_program(res, subdir, work_dir, bin_dir, capture, time0_test):
+  program = subdir
+
+  # run.py
+  if os.path.exists(os.path.join(work_dir, 'run.py')):
+    res.print_all ('     Found run.py. Running this script.')
+    command = 'python run.py ' + bin_dir
+
+  else:
+    program = bin_dir + program
+    res.print_all ('     Running program: ' + program)
+
+    if not os.path.isfile(os.path.join(work_dir, program)):
+      res.print_all ('     !!! Program does not exist!', True, True, True)
+      return False
 
-  if len(dir_split) > 2:
-    print_all ('\nExtra stuff on line in "TESTS.LIST": ' + dir_split, True, True, True)
-    continue
+    command = program
 
-  max_fail = 0
-  if len(dir_split) == 2: max_fail = int(dir_split[1])
+  sys.stdout.flush()
+  res.timed_out, rusage, output = run_command(command, work_dir, res.timeout, capture)
+  if capture: res.program_output(output)
+
+  res.duration = time.time() - time0_test
+  res.cpu_user = rusage.ru_utime
+  res.cpu_sys = rusage.ru_stime
+  # ru_maxrss is carried across fork and exec so it includes the memory of this (forked) process. So for
+  # small tests this is the footprint of run_tests.py and in general it is an upper bound.
+  res.max_rss = rusage.ru_maxrss / 1024            # ru_maxrss is in kB on Linux.
+  if sys.platform == 'darwin': res.max_rss = res.max_rss / 1024   # And bytes on macOS.
+
+  if res.timed_out:
+    res.print_all ('     !!! Program killed after exceeding the time limit of ' + str(res.timeout) + ' sec', True, True, True)
+    print_resources(res)
+    return False
+
+  return True
+
+#----------------------------------------------------------
+# Run the program(s) in one regression subdirectory and compare output.now with output.correct.
+# The subdirectory is used as the working directory of the program. The current directory is not changed.
+# If capture is True, program output is saved in the result instead of going to the terminal.
+# If cache_key is not None, output.now is taken from, or saved to, the cache (a result_cache_class instance).
+# If use_cached is False, the program is always run.
+# If run_dir is not blank, the test is run in run_dir/<subdir> (see scratch_dir.py). This directory is
+# removed if the test passes.
+
+def run_test(test_dir, bin_dir, timeout = 0, max_failures = 0, capture = False, echo = True,
+                                                 cache = None, cache_key = None, use_cached = True, run_dir = ''):
+  time0_test = time.time()
+  dir_split = test_dir.split()
+  res = test_result_struct(dir_split[0], echo)
+  res.timeout = timeout
+
+  # Line syntax: <subdir> {<max_fail>} {timeout=<sec>} {cores=<n>}
+
+  n_extra = 0
+  for word in dir_split[1:]:
+    if word[:8] == 'timeout=':
+      res.timeout = float(word[8:])
+    elif word[:6] == 'cores=':
+      res.cores = int(word[6:])
+    elif n_extra == 0:
+      res.max_fail = int(word)
+      n_extra += 1
+    else:
+      res.print_all ('\nExtra stuff on line in "TESTS.LIST": ' + test_dir, True, True, True)
+      return res
 
   subdir = dir_split[0]
   if subdir[-1] == "/": subdir = subdir[:-1]
+  res.subdir = subdir
 
   if not os.path.exists(subdir):
-    print_all ('\nNon-existant subdirectory given in "TESTS.LIST": ' + subdir, True, True, True)
-    continue
+    res.print_all ('\nNon-existant subdirectory given in "TESTS.LIST": ' + subdir, True, True, True)
+    return res
 
-  os.chdir(subdir)
+  res.print_all ('\n%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%')
+  res.print_all ('Starting testing in subdirectory: ' + subdir)
 
-  print_all ('\n%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%')
-  print_all ('Starting testing in subdirectory: ' + subdir)
+  # Make the scratch directory if needed and remove output.now
 
-  # Remove output.now
+  work_dir = subdir
+  if run_dir != '':
+    work_dir = os.path.join(run_dir, subdir)
+    scratch_dir.populate(subdir, work_dir)
 
-  os.system('rm output.now')
+  now_file = os.path.join(work_dir, 'output.now')
+  correct_file = os.path.join(work_dir, 'output.correct')
+  if os.path.exists(now_file): os.remove(now_file)
 
-  # Run process and make sure output.now has been created
+  # Run process and make sure output.now has been created.
+  # If the program and input files are unchanged, use the cached output.now.
 
-  program = subdir
-  if program[-1] == '/': program = program[:-1]
+  cached_file = None
+  if cache_key is not None and use_cached: cached_file = cache.cached_output(subdir, cache_key)
 
-  # run.py
-  if os.path.exists('run.py'):
-    print_all ('     Found run.py. Running this script.')
-    os.system('python run.py ' + bin_dir)
+  if cached_file is not None:
+    shutil.copyfile(cached_file, now_file)
+    res.cached = True
+    res.print_all ('     Program and input files unchanged. Using cached "output.now".')
+  elif not run_program(res, subdir, work_dir, bin_dir, capture, time0_test):
+    return res
+
+  # Look for output
+
+  if not os.path.isfile(now_file):
+    res.print_all ('     !!! Program failed to create "output.now" file', True, True, True)
+    return res
+
+  if cache_key is not None and not res.cached: cache.save_output(subdir, cache_key, now_file)
+
+  if not os.path.isfile(correct_file):
+    res.print_all ('     !!! No "output.correct" file', True, True, True)
+    return res
+
+  compare_output(res, now_file, correct_file, max_failures)
+
+  #------------------
 
+  res.print_all ('     Number of tests:        ' + str(res.num_tests))
+  res.print_all ('     Number of failed tests: ' + str(res.num_failures), False, color = (res.num_failures != 0))
+  if not res.cached: print_resources(res)
+  res.print_all ('     Maximum allowed failed tests: ' + str(res.max_fail))
+  if res.num_failures > res.max_fail:
+    res.print_all ('     Grade for tests in subdirectory ' + subdir + ': FAILED!', False, True, True)
+    if work_dir != subdir: res.print_all ('     Test run directory: ' + work_dir)
   else:
-    program = bin_dir + program
-    print_all ('     Running program: ' + program)
-  
-    if not os.path.isfile(program):
-      print_all ('     !!! Program does not exist!', True, True, True)
-      os.chdir('..')
-      continue
+    res.print_all ('     Grade for tests in subdirectory ' + subdir + ': Passed.')
+    if work_dir != subdir: shutil.rmtree(work_dir)
 
-    os.system(program)
+  return res
 
-  # Look for output
+#----------------------------------------------------------
+# Pool worker. Output is saved in the result to be printed by the main process.
 
-  if not os.path.isfile('output.now'):
-    print_all ('     !!! Program failed to create "output.now" file', True, True, True)
-    os.chdir('..')
-    continue
+def run_test_worker(args):
+  test_dir, bin_dir, timeout, max_failures, cache, cache_key, use_cached, run_dir = args
+  return run_test(test_dir, bin_dir, timeout, max_failures, capture = True, echo = False,
+                                        cache = cache, cache_key = cache_key, use_cached = use_cached, run_dir = run_dir)
 
-  if not os.path.isfile('output.correct'):
-    print_all ('     !!! No "output.correct" file', True, True, True)
-    os.chdir('..')
-    continue
+#----------------------------------------------------------
+# Number of cores used by a test as set by "cores=<n>" on the TESTS.LIST line. Default is 1.
 
-  # Compare the output of the program "output.now" to the expected output "output.correct"
+def test_cores(test_dir):
+  for word in test_dir.split()[1:]:
+    if word[:6] == 'cores=': return int(word[6:])
+  return 1
 
-  now_file = open('output.now', 'r')  
-  correct_file = open('output.correct', 'r')
-  test_count = 0
+#----------------------------------------------------------
+# Main program.
+# List of tests is in "test.list".
 
-  while True:
+if __name__ == '__main__':
+  bin_dir = '../production/bin/'
+  test_dir_list = []
+  test_list_file = 'TESTS.LIST'
+  num_jobs = 1
+  timeout = 0
+  history_file = 'regression.history'
+  perf_threshold = 0
+  max_failures = 0
+  changed_ref = ''
+  json_file = ''
+  junit_file = ''
+  cache_dir = ''
+  use_cached = True
+  scratch = ''
+  results_file = 'regression.results'
+  all_results = []
+  test_times = {}
+  time0 = time.time()
+
+  i = 1
+  while i < len(sys.argv):
+    if sys.argv[i] == '-bin':
+      bin_dir = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-test':
+      test_dir_list = [sys.argv[i+1]]
+      i += 1
+    elif sys.argv[i] == '-list':
+      test_list_file = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-debug':
+      bin_dir = '../debug/bin'
+    elif sys.argv[i] == '-j':
+      num_jobs = int(sys.argv[i+1])
+      i += 1
+    elif sys.argv[i] == '-timeout':
+      timeout = float(sys.argv[i+1])
+      i += 1
+    elif sys.argv[i] == '-history':
+      history_file = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-json':
+      json_file = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-junit':
+      junit_file = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-cache':
+      cache_dir = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-no_cache':
+      use_cached = False
+    elif sys.argv[i] == '-scratch':
+      scratch = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-results':
+      results_file = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-changed':
+      changed_ref = sys.argv[i+1]
+      i += 1
+    elif sys.argv[i] == '-max_failures':
+      max_failures = int(sys.argv[i+1])
+      i += 1
+    elif sys.argv[i] == '-perf_check':
+      perf_threshold = float(sys.argv[i+1])
+      i += 1
+    else:
+      print_help()
 
-    while True:
-      now_line = now_file.readline()
-      if len(now_line) == 0: break                # End of file
-      if len(now_line.strip()) == 0: continue     # Skip blank line
-      if now_line.strip()[0] == '!': continue     # Skip comment line
-      break
+    i += 1
 
-    while True:
-      correct_line = correct_file.readline()
-      if len(correct_line) == 0: break                # End of file
-      if len(correct_line.strip()) == 0: continue     # Skip blank line
-      if correct_line.strip()[0] == '!': continue     # Skip comment line
-      break
+  results = open(results_file, 'w')
 
-    if len(now_line) == 0 or len(correct_line) == 0: 
-      print_all ('')
-      if len(now_line) != 0:
-        print_all ('     Confusion! End of "output.correct" reached before End of "output.now"', True, True, True)
-      if len(correct_line) != 0:
-        print_all ('     Confusion! End of "output.now" reached before End of "output.correct"', True, True, True)
-      break
+  if bin_dir[0] != '/' and bin_dir[0] != '$': bin_dir = '../' + bin_dir
+  if bin_dir[-1] != '/': bin_dir = bin_dir + '/'
+  if len(test_dir_list) == 1 and test_dir_list[0] == 'all': test_dir_list = []
 
-    now_line = now_line.strip()
-    correct_line = correct_line.strip()
+  if len(test_dir_list) == 0:
+    dir_file = open (test_list_file, 'r')
+    test_dir_list = dir_file.readlines()
 
-    now_split = now_line.split('"', 2)
-    correct_split = correct_line.split('"', 2)
-    
-    if now_split[0] != '' or len(now_split) != 3:
-      print_all ('     Cannot parse line from "output.now": ' + now_line, True, True, True)
-      break
+  # Strip comments. Notes are kept in place so they are printed in order with the test results.
 
-    if correct_split[0] != '' or len(correct_split) != 3:
-      print_all ('     Cannot parse line from "output.correct": ' + correct_line, True, True, True)
-      break
+  entry_list = []
+  for test_dir in test_dir_list:
+    test_dir = test_dir.strip()
+    ix = test_dir.find('!')
+    if ix != -1: test_dir = test_dir[:ix]
+    if len(test_dir) == 0: continue
+    entry_list.append(test_dir)
+
+  test_list = [entry for entry in entry_list if entry[:5] != 'NOTE:']
 
-    if now_split[1] != correct_split[1]:
-      print_all ('     Identification string for a line in "output.now":    ' + now_split[1], False, True, True)
-      print_all ('     Does not match corresponding ID in "output.correct": ' + correct_split[1], True, True, True)
-
-    now_end = now_split[2].strip().split()
-
-    #----------------------------------------------
-    # String test
-
-    num_local_tests += 1
-
-    if now_end[0] == 'STR':
-      now2_split = now_split[2].split('"')
-      correct2_split = correct_split[2].split('"')[1:]
-
-      if len(now2_split) < 2:
-        print_all ('     Bad line line "output.now": ' + now_line, True, True, True)
-        break
-
-      now2_split.pop(0)    # Get rid of STR item.
-
-      if len(now2_split) != len(correct2_split):
-        print_all ('     Number of components in "output.now" line: ' + now_line, False, True, True)
-        print_all ('     Does not match number in "output.correct:  ' + correct_line, True, True, True)
-        break
-
-      for ix, (now1, correct1) in enumerate(list(zip(now2_split, correct2_split))):
-        if now1 != correct1:
-          print_all ('')
-          if len(now2_split) == 2:     # Will always have blank item in list.
-            print_all ('     Regression test failed:', color = True)
-          else:
-            print_all ('     Regression test failed for datum number: ' + str(ix+1), color = True)
-          print_all ('          Line from "output.now": ' + now_line, color = True)
-          print_all ('          Line from "output.correct": ' + correct_line, color = True)
-          num_local_failures += 1
-          break
-
-    #----------------------------------------------
-    # Real test
-
-    elif now_end[0] == 'ABS' or now_end[0] == 'REL' or now_end[0] == 'VEC_REL':
-      now2_split = now_split[2].strip().split()
-      correct2_split = correct_split[2].strip().split()[2:]   # [2:] -> Throw away EG: "ABS 2E-7"
-      
-      if len(now2_split) < 3:
-        print_all ('     Bad line in "output.now": ' + now_line, True, True, True)
-        break
-
-      tol_type = now2_split.pop(0)           # Pop REL or ABS item.
-      tol_val  = float(now2_split.pop(0))    # Pop tollerance
-
-      if len(now2_split) != len(correct2_split):
-        print_all ('     Number of components in "output.now" line: ' + now_line, False, True, True)
-        print_all ('     Does not match number in "output.correct:  ' + correct_line, True, True, True)
-        break
-
-      bad_at = -1
-      bad_diff_val  = 0
-
-      if tol_type == 'VEC_REL':
-        vec_amp = 0
-        for ix, (now1, correct1) in enumerate(list(zip(now2_split, correct2_split))):
-          now_val = float(now1)
-          correct_val = float(correct1)
-          vec_amp += ((abs(now_val) + abs(correct_val)) / 2) ** 2
-        vec_amp = math.sqrt(vec_amp)
-
-      for ix, (now1, correct1) in enumerate(list(zip(now2_split, correct2_split))):
-        try:
-          now_val = float(now1)
-        except:
-          now_val = 1e100
-        correct_val = float(correct1)
-        diff_val = abs(now_val - correct_val)
-        abs_val = (abs(now_val) + abs(correct_val)) / 2
-        factor = 1
-        if tol_type == 'REL': factor = abs_val
-        if tol_type == 'VEC_REL': factor = vec_amp
-
-        if diff_val > factor * tol_val and diff_val > bad_diff_val: 
-          bad_at = ix
-          bad_diff_val = diff_val
-          bad_abs_val = abs_val
-
-      if bad_at > -1:
-        print_all ('')
-        if now_end[0] == 'STR':
-          print_all ('     Regression test failed for: "' + now_split[1] + '"', color = True)
-        else:
-          print_all ('     Regression test failed for: "' + now_split[1] + '"   ' + now_end[0] + '   ' + now_end[1], color = True)
-        if len(now2_split) != 1: 
-          print_all ('     Regression test failed for datum number: ' + str(bad_at+1), color = True)
-        print_all ('        Data from "output.now":     ' + str(now2_split), color = True)
-        print_all ('        Data from "output.correct": ' + str(correct2_split), color = True)
-        print_all ('        Diff: ' + str(bad_diff_val) + '  Diff/Val: ' + str(abs(bad_diff_val) / bad_abs_val), color = True)
-        num_local_failures += 1
-
-    #----------------------------------------------
-    # Error test
+  # Only run tests affected by source changes.
 
+  if changed_ref != '':
+    test_names = [entry.split()[0].rstrip('/') for entry in test_list]
+    changed = test_select.changed_files(changed_ref, [json_file, junit_file, results_file, history_file])
+    selected = None
+    if changed is None:
+      print_all ('Cannot get list of changed files from git. Running all tests.', color = True)
     else:
-      print_all ('     Bad data ID string in "output.now" file: ' + now_line, False, True, True)
-      print_all ('     Should be one of: STR, REL, or ABS.', True, True, True)
-      break
+      selected, unmapped = test_select.select_tests(test_names, changed, test_select.load_test_map())
+      if selected is None: print_all ('Changed file cannot be mapped to tests: ' + unmapped + '. Running all tests.', color = True)
+
+    if selected is not None:
+      print_all ('Running ' + str(len(selected)) + ' of ' + str(len(test_list)) + ' tests affected by changes relative to ' + changed_ref)
+      entry_list = [entry for entry in entry_list if entry[:5] == 'NOTE:' or entry.split()[0].rstrip('/') in selected]
+      test_list = [entry for entry in entry_list if entry[:5] != 'NOTE:']
+
+  # Cache keys of the tests. The keys are computed here so each file is only hashed once.
+
+  cache = None
+  cache_keys = {}
+  if cache_dir != '':
+    cache = result_cache.result_cache_class(cache_dir)
+    for test_dir in test_list:
+      cache_keys[test_dir] = cache.test_key(test_dir.split()[0].rstrip('/'), bin_dir)
+    cache.save_hashes()
+
+  # Scratch directory for this run.
+
+  run_dir = ''
+  if scratch != '':
+    test_subdirs = [test_dir.split()[0].rstrip('/') for test_dir in test_list]
+    run_dir = scratch_dir.make_run_root(scratch, '.', test_subdirs)
+    print_all ('Running tests in: ' + run_dir)
+
+  # Parallel run: Start the tests longest first using the run times in the history file.
+  # Tests that will use a cached output are expected to take no time.
+
+  if num_jobs > 1:
+    expected = {}
+    if history_file != '':
+      times = perf_history.expected_times(perf_history.read_history(history_file), bin_dir)
+      for test_dir in test_list:
+        subdir = test_dir.split()[0].rstrip('/')
+        if subdir in times: expected[test_dir] = times[subdir]
+        if use_cached and cache_keys.get(test_dir) is not None and cache.has_output(subdir, cache_keys[test_dir]): expected[test_dir] = 0
+
+    cores = dict((test_dir, test_cores(test_dir)) for test_dir in test_list)
+    order = test_schedule.lpt_order(test_list, expected)
+    tasks = dict((test_dir, (test_dir, bin_dir, timeout, max_failures, cache, cache_keys.get(test_dir), use_cached,
+                                                                                          run_dir)) for test_dir in test_list)
+    predicted = test_schedule.predict_makespan(order, expected, cores, num_jobs)
+
+    time0_parallel = time.time()
+    pool = Pool(min(num_jobs, max(len(test_list), 1)))
+    scheduler = test_schedule.test_scheduler_class(pool, run_test_worker, tasks, order, cores, num_jobs)
+
+  #-------------------------------------------------------------
+
+  for test_dir in entry_list:
+
+    # Is this a note:
+
+    if test_dir[:5] == 'NOTE:':
+      print_all ('Note in TESTS.LIST file: ' + test_dir, False, True, False)
+      continue
 
-  #------------------
+    #-----------------------------------------------------------
+    # Run the programs
 
-  print_all ('     Number of tests:        ' + str(num_local_tests))
-  print_all ('     Number of failed tests: ' + str(num_local_failures), False, color = (num_local_failures != 0))
-  print_all ('     Duration of test (sec): ' + str(time.time() - time0_test))
-  print_all ('     Maximum allowed failed tests: ' + str(max_fail))
-  if num_local_failures > max_fail: 
-    print_all ('     Grade for tests in subdirectory ' + subdir + ': FAILED!', False, True, True)
-  else:
-    print_all ('     Grade for tests in subdirectory ' + subdir + ': Passed.')
+    num_programs += 1
+
+    if num_jobs > 1:
+      res = scheduler.result(test_dir)
+      res.replay()
+    else:
+      res = run_test(test_dir, bin_dir, timeout, max_failures, cache = cache, cache_key = cache_keys.get(test_dir),
+                                                                                  use_cached = use_cached, run_dir = run_dir)
+
+    all_results.append(res)
+
+    num_tests += res.num_tests
+    num_failures += res.num_failures
+    if res.duration > 0 and not res.timed_out:
+      test_times[res.subdir] = {'wall': res.duration, 'cpu_user': res.cpu_user, 'cpu_sys': res.cpu_sys, 'max_rss': res.max_rss}
+
+  if num_jobs > 1:
+    pool.close()
+    pool.join()
+    n_unknown = len([test_dir for test_dir in test_list if test_dir not in expected])
+    if n_unknown == len(test_list):
+      print_all ('\nParallel run time (sec): %.2f   (No timing history for prediction)' % (time.time() - time0_parallel))
+    else:
+      print_all ('\nParallel run time (sec): %.2f   Predicted from history: %.2f   (Tests with no history: %d of %d)' %
+                                                 (time.time() - time0_parallel, predicted, n_unknown, len(test_list)))
 
+  if run_dir != '' and not scratch_dir.cleanup(run_dir, test_subdirs):
+    print_all ('Run directories of failed tests are kept in: ' + run_dir)
 
-  num_tests += num_local_tests
-  num_failures += num_local_failures
+  #------------------------------------------------------------
+  # Structured reports
 
-  os.chdir('..')
-  
-#------------------------------------------------------------
+  run_info = {'bin_dir': bin_dir, 'commit': perf_history.git_commit(), 'num_jobs': num_jobs}
+  if json_file != '': result_report.write_json(json_file, all_results, run_info, time.time() - time0)
+  if junit_file != '': result_report.write_junit(junit_file, all_results, run_info, time.time() - time0)
 
+  #------------------------------------------------------------
+  # Performance history
 
-print_all ('Total number of tests:           ' + str(num_tests))
-print_all ('Total number of failed tests:    ' + str(num_failures), color = (num_failures != 0))
-print_all ('Number of Program flow failures: ' + str(num_flow_failures), color = (num_flow_failures != 0))
-print_all ('Duration of all tests (sec): %5.2f' % (time.time() - time0))
+  if history_file != '' and len(test_times) > 0:
+    perf_history.append_run(history_file, bin_dir, test_times)
 
-print('Results file: regression.results')
+    if perf_threshold > 0:
+      slow = perf_history.find_slowdowns(perf_history.read_history(history_file), perf_threshold)
+      for subdir, wall, base_wall, ratio in slow:
+        print_all ('Test run time slowdown: %s  %.2f sec  (baseline %.2f sec, x%.2f)' % (subdir, wall, base_wall, ratio), False, True, True)
 
-if pass_all_tests:
-  print_all ('\nBottom line for all tests: The code PASSES regression testing.')
-  exit(0)
-else:
-  print_all ('\nBottom line for all tests: The code FAILS regression testing.', color = True)
-  exit(1)
+  #------------------------------------------------------------
 
-results.close()
 
+  print_all ('Total number of tests:           ' + str(num_tests))
+  print_all ('Total number of failed tests:    ' + str(num_failures), color = (num_failures != 0))
+  print_all ('Number of Program flow failures: ' + str(num_flow_failures), color = (num_flow_failures != 0))
+  if cache is not None:
+    print_all ('Number of tests using cached output: ' + str(len([res for res in all_results if res.cached])))
+  print_all ('Duration of all tests (sec): %5.2f' % (time.time() - time0))
+
+  print('Results file: ' + results_file)
+
+  if pass_all_tests:
+    print_all ('\nBottom line for all tests: The code PASSES regression testing.')
+    exit(0)
+  else:
+    print_all ('\nBottom line for all tests: The code FAILS regression testing.', color = True)
+    exit(1)
+
+  results.close()
@@ -0,0 +1,89 @@
+#+
+# Scratch directories for running regression tests outside of the source tree.
+#
+# With the run_tests.py "-scratch <scratch_dir>" option, each run gets its own directory in <scratch_dir>
+# (the "run root") which mirrors the distribution: The top level directories of the distribution and
+# the entries of the regression_tests directory are symbolic links to the originals so relative paths
+# like "../../production/bin" and "../scripts" still work. Only the test subdirectories are real
+# directories. The files of a test subdirectory are put in its scratch directory as a reflink
+# (copy-on-write clone) if the file system supports it and otherwise as a copy. Files are never hard
+# linked since a program writing to a hard linked file would change the original in the source tree.
+# Since programs only write to the scratch directories, two runs (EG production and debug) can be done
+# at the same time.
+#-
+
+import os
+import sys
+import shutil
+import tempfile
+
+FICLONE = 0x40049409      # Linux ioctl to make a reflink.
+
+#----------------------------------------------------------
+# Make the run root directory in scratch_dir and return its name.
+# reg_dir is the regression_tests directory and test_subdirs are the subdirectories that will be
+# run. These are not linked and are created by populate.
+
+def make_run_root(scratch_dir, reg_dir, test_subdirs):
+  reg_dir = os.path.abspath(reg_dir)
+  root_dir = os.path.dirname(reg_dir)
+  reg_name = os.path.basename(reg_dir)
+
+  os.makedirs(scratch_dir, exist_ok = True)
+  run_root = tempfile.mkdtemp(prefix = 'regression_', dir = scratch_dir)
+
+  for name in os.listdir(root_dir):
+    if name == reg_name: continue
+    os.symlink(os.path.join(root_dir, name), os.path.join(run_root, name))
+
+  os.mkdir(os.path.join(run_root, reg_name))
+  for name in os.listdir(reg_dir):
+    if name in test_subdirs: continue
+    os.symlink(os.path.join(reg_dir, name), os.path.join(run_root, reg_name, name))
+
+  return os.path.join(run_root, reg_name)
+
+#----------------------------------------------------------
+# Put file src at dst. Return 'reflink' or 'copy'.
+
+def place_file(src, dst):
+  if sys.platform.startswith('linux'):
+    try:
+      import fcntl
+      with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+        fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+      shutil.copystat(src, dst)
+      return 'reflink'
+    except (OSError, ImportError):
+      if os.path.exists(dst): os.remove(dst)
+
+  shutil.copy2(src, dst)
+  return 'copy'
+
+#----------------------------------------------------------
+# Fill the scratch directory work_dir with the files of the test subdirectory subdir.
+# An old output.now is not copied. Symbolic links are copied as links.
+
+def populate(subdir, work_dir):
+  for file_dir, sub_dirs, files in os.walk(subdir):
+    dst_dir = os.path.join(work_dir, os.path.relpath(file_dir, subdir))
+    os.makedirs(dst_dir, exist_ok = True)
+
+    for name in sub_dirs + files:
+      src = os.path.join(file_dir, name)
+      dst = os.path.join(dst_dir, name)
+      if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        if name in sub_dirs: sub_dirs.remove(name)     # Do not walk into linked directories.
+      elif name in files and not (file_dir == subdir and name == 'output.now'):
+        place_file(src, dst)
+
+#----------------------------------------------------------
+# Remove the run root made by make_run_root if none of the test scratch directories are left.
+# Return True if removed.
+
+def cleanup(reg_run_dir, test_subdirs):
+  for subdir in test_subdirs:
+    if os.path.exists(os.path.join(reg_run_dir, subdir)): return False
+  shutil.rmtree(os.path.dirname(reg_run_dir))
+  return True
@@ -0,0 +1,92 @@
+#+
+# Helper for regression test run.py scripts that run more than one independent program.
+#
+# The programs are started at the same time with subprocess and their output (stdout and stderr) is
+# captured. Since the results are returned, and output files concatenated, in the order the runs
+# are given, the "output.now" file does not depend on which program finishes first.
+#
+# Only run programs at the same time if they do not write to the same files. In particular, bmad_parser
+# writes a digested file next to the lattice file, so programs that parse the same lattice file must be
+# run in different directories, each with its own copy of the lattice files (see make_run_dir).
+#
+# Example run.py:
+#   import os, sys
+#   sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+#   import sub_runs
+#
+#   for sim in ['sim1', 'sim2']:
+#     sub_runs.make_run_dir(sim, ['lat.bmad', sim + '.init'])
+#   exe = sub_runs.exe_path(sys.argv[1], 'long_term_tracking')
+#   runs = sub_runs.run_concurrent([sub_runs.sub_run_struct([exe, 'sim1.init'], 'sim1'),
+#                                   sub_runs.sub_run_struct([exe, 'sim2.init'], 'sim2')])
+#   sub_runs.cat_files(['sim1/sim1.dat', 'sim2/sim2.dat'], 'output.now')
+#-
+
+import os
+import sys
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+#----------------------------------------------------------
+# One program run. command is the argument list. cwd is the directory to run in.
+
+class sub_run_struct:
+  def __init__(self, command, cwd = '.'):
+    self.command = command
+    self.cwd = cwd
+    self.returncode = None
+    self.output = ''
+
+#----------------------------------------------------------
+# Full path of the program exe_name in bin_dir, the directory passed to run.py by run_tests.py.
+# The path is absolute so it can be used with any cwd.
+
+def exe_path(bin_dir, exe_name):
+  return os.path.abspath(os.path.join(os.path.expandvars(bin_dir), exe_name))
+
+#----------------------------------------------------------
+
+def run_one(sub_run):
+  proc = subprocess.run(sub_run.command, cwd = sub_run.cwd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+  sub_run.returncode = proc.returncode
+  sub_run.output = proc.stdout.decode('utf-8', 'replace')
+  return sub_run
+
+#----------------------------------------------------------
+# Run all sub_runs concurrently and wait for them to finish.
+# If echo is True, the output of each run is printed, in order, after all runs are done.
+# max_jobs is the maximum number of runs at one time. 0 -> No limit.
+
+def run_concurrent(sub_runs, echo = True, max_jobs = 0):
+  if max_jobs < 1: max_jobs = max(len(sub_runs), 1)
+  with ThreadPoolExecutor(max_jobs) as pool:
+    list(pool.map(run_one, sub_runs))
+
+  if echo:
+    for sub_run in sub_runs:
+      sys.stdout.write(sub_run.output)
+    sys.stdout.flush()
+
+  return sub_runs
+
+#----------------------------------------------------------
+# Make directory dir_name, removing any old one, and copy the files file_names into it.
+
+def make_run_dir(dir_name, file_names):
+  if os.path.isdir(dir_name): shutil.rmtree(dir_name)
+  os.makedirs(dir_name)
+  for file_name in file_names:
+    shutil.copy2(file_name, dir_name)
+
+#----------------------------------------------------------
+# Concatenate files, in the order given, into out_name. Missing files are skipped.
+# If remove is True, the files are deleted afterwards.
+
+def cat_files(file_names, out_name = 'output.now', remove = True):
+  with open(out_name, 'w') as f_out:
+    for file_name in file_names:
+      if not os.path.isfile(file_name): continue
+      with open(file_name, 'r') as f_in:
+        f_out.write(f_in.read())
+      if remove: os.remove(file_name)
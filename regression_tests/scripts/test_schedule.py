@@ -0,0 +1,97 @@
+#+
+# Scheduling of regression tests run in parallel.
+#
+# The tests are started longest first (LPT scheduling) using the expected run times from the timing
+# history (see perf_history.py). This way the long tests do not start last and stretch the total run time.
+# A test can be given a number of cores with "cores=<n>" in TESTS.LIST. This is for tests that are
+# themselves multithreaded. A test is only started when enough cores are free. If the longest waiting
+# test does not fit, the longest test that does fit is started. A test needing more cores than the
+# number of jobs is run when nothing else is running.
+#-
+
+import queue
+
+#----------------------------------------------------------
+# Return the list of test names ordered by decreasing expected run time.
+# expected is a dict of name -> expected time. Tests with no history get the median time of the others.
+
+def lpt_order(names, expected):
+  known = sorted(expected[name] for name in names if name in expected)
+  default = known[len(known)//2] if len(known) > 0 else 0
+  return sorted(names, key = lambda name: -expected.get(name, default))
+
+#----------------------------------------------------------
+# Return index of the first test in the waiting list that fits in free_cores cores.
+# A test needing more cores than num_jobs fits if nothing is running. Return -1 if none fit.
+
+def next_test(waiting, cores, free_cores, num_jobs):
+  for ix, name in enumerate(waiting):
+    need = min(cores.get(name, 1), num_jobs)
+    if need <= free_cores: return ix
+  return -1
+
+#----------------------------------------------------------
+# Return the predicted total run time (makespan) when the tests, in the given order, are run with
+# num_jobs cores. times is a dict of name -> expected time. cores is a dict of name -> number of cores.
+
+def predict_makespan(order, times, cores, num_jobs):
+  waiting = list(order)
+  running = []     # [end_time, name]
+  free_cores = num_jobs
+  now = 0
+
+  while len(waiting) > 0 or len(running) > 0:
+    while True:
+      ix = next_test(waiting, cores, free_cores, num_jobs)
+      if ix == -1: break
+      name = waiting.pop(ix)
+      free_cores -= min(cores.get(name, 1), num_jobs)
+      running.append([now + times.get(name, 0), name])
+
+    running.sort()
+    now, name = running.pop(0)
+    free_cores += min(cores.get(name, 1), num_jobs)
+
+  return now
+
+#----------------------------------------------------------
+# Run tests with a multiprocessing pool in the order given. The pool should have num_jobs processes.
+# tasks is a dict of name -> argument for func.
+# Results are obtained, in any order, with result(name) which waits for the test to finish.
+
+class test_scheduler_class:
+  def __init__(self, pool, func, tasks, order, cores, num_jobs):
+    self.pool = pool
+    self.func = func
+    self.tasks = tasks
+    self.waiting = list(order)
+    self.cores = cores
+    self.num_jobs = num_jobs
+    self.free_cores = num_jobs
+    self.done = queue.Queue()
+    self.results = {}
+    self.start()
+
+  #----------------------------------------------------------
+  # Start as many waiting tests as fit in the free cores.
+
+  def start(self):
+    while True:
+      ix = next_test(self.waiting, self.cores, self.free_cores, self.num_jobs)
+      if ix == -1: return
+      name = self.waiting.pop(ix)
+      self.free_cores -= min(self.cores.get(name, 1), self.num_jobs)
+      self.pool.apply_async(self.func, (self.tasks[name],),
+                            callback = lambda res, name = name: self.done.put([name, res, None]),
+                            error_callback = lambda err, name = name: self.done.put([name, None, err]))
+
+  #----------------------------------------------------------
+
+  def result(self, name):
+    while name not in self.results:
+      done_name, res, err = self.done.get()
+      if err is not None: raise err
+      self.results[done_name] = res
+      self.free_cores += min(self.cores.get(done_name, 1), self.num_jobs)
+      self.start()
+    return self.results.pop(name)
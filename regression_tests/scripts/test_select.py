@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+#+
+# Selection of the regression tests affected by changes to the source code.
+#
+# The test map is made from the CMake files: The cmake_files/cmake.* specs give the libraries each test
+# program links to, and the CMakeLists.txt of each library directory in the distribution (bmad,
+# sim_utils, tao, etc.) gives the libraries that library depends on. A change to a file in a library
+# directory selects all tests that link, directly or indirectly, to that library. A change to a file
+# in a regression subdirectory selects that test. Tests without a cmake spec (tests that use run.py
+# to run a distribution program) are selected whenever any library is changed.
+#
+# The map is cached in "test_map.cache" and is rebuilt when any of the CMake files it was made from
+# has changed. If a changed file cannot be mapped to tests, the full test list is used.
+#
+# Usage:
+#   test_select.py {<git_ref>}     ! Print tests affected by changes relative to <git_ref> (default HEAD).
+#-
+
+import os
+import re
+import sys
+import json
+import glob
+import subprocess
+
+regression_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+root_dir = os.path.dirname(regression_dir)
+cache_file = os.path.join(regression_dir, 'test_map.cache')
+
+# Directories with no code used by the regression tests.
+no_test_dirs = ['bmad-doc', 'code_examples', 'util_programs']
+
+# Files made by running the tests.
+generated_files = ['output.now', 'regression.results', 'regression.history', 'test_map.cache']
+
+#----------------------------------------------------------
+# Return the list of words in a CMake "set (<name> ...)" command. Case insensitive.
+
+def cmake_set(text, name):
+  match = re.search(r'^\s*set\s*\(\s*' + name + r'\b(.*?)\)', text, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+  if match is None: return []
+  words = []
+  for line in match.group(1).split('\n'):
+    line = line.split('#')[0]
+    words += line.split()
+  return words
+
+#----------------------------------------------------------
+# The ACC_BMAD_LINK_LIBS list used in the cmake files.
+
+def bmad_link_libs():
+  libs = os.environ.get('ACC_BMAD_LINK_LIBS', '')
+  if libs == '':
+    config = os.path.join(root_dir, 'util', 'build_flags_config')
+    if os.path.isfile(config):
+      match = re.search(r'ACC_BMAD_LINK_LIBS="([^"]*)"', open(config).read())
+      if match is not None: libs = match.group(1)
+  return libs.split(';')
+
+#----------------------------------------------------------
+
+def expand_libs(words):
+  libs = []
+  for word in words:
+    if 'ACC_BMAD_LINK_LIBS' in word:
+      libs += bmad_link_libs()
+    elif word[0] != '$':
+      libs.append(word)
+  return libs
+
+#----------------------------------------------------------
+# Build the test map.
+# Return dict with:
+#   'libs':   library name -> [directory, libraries it depends on (recursively)]
+#   'tests':  test name -> libraries the test depends on. Tests without a cmake spec are not included.
+#   'inputs': file name -> modification time for all files the map was made from.
+
+def build_test_map():
+  inputs = {}
+  libs = {}
+
+  for cmake_list in sorted(glob.glob(os.path.join(root_dir, '*', 'CMakeLists.txt'))):
+    text = open(cmake_list).read()
+    name = cmake_set(text, 'LIBNAME')
+    if len(name) == 0: continue
+    inputs[cmake_list] = os.path.getmtime(cmake_list)
+    deps = expand_libs(cmake_set(text, 'SHARED_DEPS') + cmake_set(text, 'LINK_LIBS'))
+    libs[name[0]] = [os.path.basename(os.path.dirname(cmake_list)), deps]
+
+  # Only libraries in the distribution matter. Make the dependencies recursive.
+
+  def all_deps(lib, found):
+    for dep in libs[lib][1]:
+      if dep in libs and dep not in found:
+        found.append(dep)
+        all_deps(dep, found)
+    return found
+
+  for lib in libs:
+    libs[lib] = [libs[lib][0], all_deps(lib, [])]
+
+  tests = {}
+  for spec in sorted(glob.glob(os.path.join(regression_dir, 'cmake_files', 'cmake.*'))):
+    inputs[spec] = os.path.getmtime(spec)
+    text = open(spec).read()
+    name = cmake_set(text, 'EXENAME')
+    if len(name) == 0: continue
+    found = []
+    for lib in expand_libs(cmake_set(text, 'LINK_LIBS')):
+      if lib in libs and lib not in found: found += [lib] + libs[lib][1]
+    tests[name[0]] = sorted(set(found))
+
+  for file in ['CMakeLists.txt', 'TESTS.LIST']:
+    file = os.path.join(regression_dir, file)
+    if os.path.isfile(file): inputs[file] = os.path.getmtime(file)
+
+  return {'libs': libs, 'tests': tests, 'inputs': inputs}
+
+#----------------------------------------------------------
+# Return the test map from the cache file, rebuilding the cache if it is stale.
+
+def load_test_map():
+  if os.path.isfile(cache_file):
+    try:
+      test_map = json.load(open(cache_file))
+      stale = False
+      for file, mtime in test_map['inputs'].items():
+        if not os.path.isfile(file) or os.path.getmtime(file) != mtime: stale = True
+      specs = glob.glob(os.path.join(regression_dir, 'cmake_files', 'cmake.*'))
+      if any(spec not in test_map['inputs'] for spec in specs): stale = True
+      if not stale: return test_map
+    except (ValueError, KeyError):
+      pass
+
+  test_map = build_test_map()
+  try:
+    with open(cache_file, 'w') as f:
+      json.dump(test_map, f, indent = 1)
+  except OSError:
+    pass
+  return test_map
+
+#----------------------------------------------------------
+# Return the list of changed files (relative to the distribution root directory) between git_ref and
+# the working tree, including untracked files. Return None if git fails.
+# ignore is a list of files (EG: the report files written by run_tests.py) that are not counted as changes.
+
+def changed_files(git_ref = 'HEAD', ignore = []):
+  ignore = [os.path.relpath(os.path.abspath(file), root_dir) for file in ignore if file != '']
+  changed = []
+  for command in [['git', 'diff', '--name-only', '--relative', git_ref], ['git', 'ls-files', '--others', '--exclude-standard']]:
+    try:
+      proc = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL, cwd = root_dir)
+    except OSError:
+      return None
+    if proc.returncode != 0: return None
+    changed += [file for file in proc.stdout.decode().split('\n') if file != '' and os.path.basename(file) not in generated_files
+                                                                                          and file not in ignore]
+  return changed
+
+#----------------------------------------------------------
+# Return [selected, None] where selected is the list of names of tests in test_names affected by the changed files.
+# Return [None, file] if the changed file could not be mapped, in which case all tests should be run.
+
+def select_tests(test_names, changed, test_map):
+  reg_name = os.path.basename(regression_dir)
+  lib_dirs = {lib_dir: lib for lib, (lib_dir, deps) in test_map['libs'].items()}
+  selected = set()
+
+  for file in changed:
+    parts = file.split('/')
+    if len(parts) == 1: continue              # README.md, etc.
+    top = parts[0]
+
+    if top in no_test_dirs: continue
+
+    if top == reg_name:
+      if len(parts) > 2 and parts[1] in test_names:
+        selected.add(parts[1])
+        continue
+      if parts[1] == 'cmake_files' and len(parts) == 3 and os.path.isfile(os.path.join(root_dir, file)):   # Test spec.
+        name = cmake_set(open(os.path.join(root_dir, file)).read(), 'EXENAME')
+        if len(name) == 0: return None, file
+        if name[0] in test_names: selected.add(name[0])
+        continue
+      if len(parts) > 2 and parts[1] not in ['scripts', 'cmake_files']: continue   # Test not in test list.
+      return None, file                       # scripts, TESTS.LIST, etc.
+
+    if top not in lib_dirs: return None, file
+    lib = lib_dirs[top]
+    for test in test_names:
+      if test not in test_map['tests'] or lib in test_map['tests'][test]: selected.add(test)
+
+  return [test for test in test_names if test in selected], None
+
+#----------------------------------------------------------
+# Main program.
+
+if __name__ == '__main__':
+  if len(sys.argv) > 2 or (len(sys.argv) == 2 and sys.argv[1][0] == '-'):
+    print('Usage: test_select.py {<git_ref>}')
+    exit()
+
+  git_ref = sys.argv[1] if len(sys.argv) == 2 else 'HEAD'
+  test_names = []
+  for line in open(os.path.join(regression_dir, 'TESTS.LIST')):
+    line = line.split('!')[0].strip()
+    if line == '' or line[:5] == 'NOTE:': continue
+    test_names.append(line.split()[0].rstrip('/'))
+
+  changed = changed_files(git_ref)
+  if changed is None:
+    print('Cannot get list of changed files from git. All tests selected.')
+    exit()
+
+  selected, unmapped = select_tests(test_names, changed, load_test_map())
+  if selected is None:
+    print('Changed file cannot be mapped to tests: ' + unmapped + '. All tests selected.')
+  else:
+    print('Changed files: ' + str(len(changed)))
+    print('Selected tests: ' + ' '.join(selected))
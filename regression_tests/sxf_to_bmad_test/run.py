@@ -0,0 +1,35 @@
+import os
+import re
+import sys
+import shutil
+import subprocess
+
+# Smoke check of the sxf_to_bmad.py "-l" (line with explicit drifts) output using the Fermilab Booster lattice.
+# The SXF file is copied here since sxf_to_bmad.py writes the Bmad file next to the SXF file.
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+script = os.path.join(root_dir, 'util_programs', 'sxf_to_bmad', 'sxf_to_bmad.py')
+shutil.copy(os.path.join(root_dir, 'bmad-doc', 'lattices', 'sxf_lattices', 'fermilab_booster.sxf'), 'fermilab_booster.sxf')
+
+proc = subprocess.run([sys.executable, script, '-l', 'fermilab_booster.sxf'], stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+print (proc.stdout.decode('utf-8', 'replace'))
+
+out_file = open('output.now', 'w')
+
+if not os.path.exists('fermilab_booster.bmad'):
+  out_file.write ('"Line-Output" STR  "BAD"\n')
+  sys.exit()
+
+text = open('fermilab_booster.bmad').read()
+out_file.write ('"Line-Output" STR  "' + ('GOOD' if 'use, machine' in text else 'BAD') + '"\n')
+
+line = re.search(r'machine: line = \((.*?)\)', text, re.DOTALL)
+n_ele = len(line.group(1).split(',')) if line else 0
+drift_len = [float(l) for l in re.findall(r'^\w+: drift, l = (\S+)$', text, re.MULTILINE)]
+out_file.write ('"Num-Line-Elements" ABS 0  ' + str(n_ele) + '\n')
+out_file.write ('"Num-Drifts"        ABS 0  ' + str(len(drift_len)) + '\n')
+out_file.write ('"Sum-Drift-Lengths" REL 1E-10  ' + '%.10e' % sum(drift_len) + '\n')
+
+out_file.close()
+os.remove('fermilab_booster.sxf')
+os.remove('fermilab_booster.bmad')
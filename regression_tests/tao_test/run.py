@@ -1,36 +1,22 @@
-import subprocess
 import os
 import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import sub_runs
 
 out_file = open('output.now', 'w')
 
-if os.path.isabs(sys.argv[1]):
-  exe = sys.argv[1] + 'tao'
-else:
-  exe = '../' + sys.argv[1] + 'tao'
+exe = sub_runs.exe_path(sys.argv[1], 'tao')
 
 #-----------
-
-print ('Test1...')
-os.chdir('test1')
-results = subprocess.run([exe, '-noplot', '-lat', 'lat.bmad'], stdout=subprocess.PIPE).stdout.decode('utf-8')
-os.chdir('..')
-
-if 'contact DCS' in results or 'FATAL' in results:
-  out_file.write ('"Bookkeeper1" STR  "BAD"\n')
-  print(results)
-else:
-  out_file.write ('"Bookkeeper1" STR  "GOOD"\n')
-
-#-----------
-
-print ('Test2...')
-os.chdir('test2')
-results = subprocess.run([exe, '-noplot', '-lat', 'lat.bmad'], stdout=subprocess.PIPE).stdout.decode('utf-8')
-os.chdir('..')
-
-if 'contact DCS' in results or 'FATAL' in results:
-  out_file.write ('"Bookkeeper2" STR  "BAD"\n')
-  print(results)
-else:
-  out_file.write ('"Bookkeeper2" STR  "GOOD"\n')
+# The tests are independent so run them at the same time.
+
+print ('Test1 and Test2...')
+runs = sub_runs.run_concurrent([sub_runs.sub_run_struct([exe, '-noplot', '-lat', 'lat.bmad'], 'test1'),
+                                sub_runs.sub_run_struct([exe, '-noplot', '-lat', 'lat.bmad'], 'test2')], echo = False)
+
+for ix, run in enumerate(runs):
+  if 'contact DCS' in run.output or 'FATAL' in run.output:
+    out_file.write ('"Bookkeeper' + str(ix+1) + '" STR  "BAD"\n')
+    print(run.output)
+  else:
+    out_file.write ('"Bookkeeper' + str(ix+1) + '" STR  "GOOD"\n')
@@ -5,14 +5,22 @@
 #   getf
 #   listf
 #   create_searchf_namelist
+#   searchf_server
+#   refs
 #
 # See the Bmad manual for a description of listf and getf.
-# See create_searchf_namelist for documentation on the searchf.namelist files
+# See create_searchf_namelist for documentation on the searchf.namelist and searchf.index files
+# See searchf_index.py for the searchf.index format.
 #-
 
 import os
 import sys
 import re
+import io
+import json
+import socket
+import tempfile
+import searchf_index
 from multiprocessing import Pool, Process
 
 # The idea is to look for a local copy of the library to search.
@@ -25,15 +33,20 @@ dist_dir = ''
 if 'ACC_RELEASE_DIR' in os.environ: release_dir   = os.environ['ACC_RELEASE_DIR'] + '/'
 if 'DIST_BASE_DIR'   in os.environ: dist_dir      = os.environ['DIST_BASE_DIR'] + '/'
 
+# When running in searchf_server, index_cache holds the in memory indexes. See searchf_server.
+
+index_cache = None
+
 class search_com_class:
   def __init__(self):
     self.found_one      = False
-    self.doc_type       = 'FULL'   # (for getf), 'SHORT' (for listf), 'LIST' (for create_searchf_namelist), or 'RAW'
+    self.doc_type       = 'FULL'   # (for getf), 'SHORT' (for listf), 'LIST' (for create_searchf_namelist), 'RAW', or 'REFS'
     self.match_str      = ''
     self.case_sensitive = False
-    self.namelist_file  = ''
     self.file_name_rel_root = ''   # File name relative to the root search directory
     self.search_only_for = ''
+    self.num_jobs       = 1        # Number of processes used for searching.
+    self.fuzzy          = False    # List names close to the search string?
 
 #------------------------------------------------------------------------------------
 #------------------------------------------------------------------------------------
@@ -94,13 +107,15 @@ def print_help_message ():
   Options:
      -c          # Case sensitive search when searching C/C++ files.
      -d <s_dir>  # Use <s_dir> as the search directory. Will not search standard directories. 
+     -f          # Fuzzy search: List names within two edits (typos) of <search_string>.
      -h          # Print this help message.
+     -j <n_proc> # Use <n_proc> processes to search files in parallel. Default is 1.
      -r <r_dir>  # Use <r_dir> as the root directory to search for the search directories.
      -s <what>   # Search only for: <what> = "struct", "routine", "parameter", or "module".
 
   Explanation: getf/listf will search the "Search directories" and any sub-directories
   for files of the type:
-      *.f90    *.inc    *.cpp    *.h    *.c
+      *.f90    *.inc    *.cpp    *.hpp    *.h    *.c
   Within each of these files getf/listf will search for any routine, struct, parameter or 
   module that matches <search_string>. Wild cards "*" and "." may be used. See the Bmad
   manual for more details.
@@ -109,6 +124,9 @@ def print_help_message ():
   search directories in a release or distribution. The exception is that if the "-r <r_dir>" option
   is used, getf/listf will only look at the subdirectories of <r_dir> for the search directories.
 
+  Searches are fast if a search directory has a searchf.index file. See create_searchf_namelist.
+  If searchf_server is running, getf/listf send the query to the server. See searchf_server.
+
   Standard Search directories:
       bmad                recipes_f-90_LEPP      
       bsim                sim_utils         
@@ -139,7 +157,61 @@ def routine_here (line2, routine_name):
 
 #------------------------------------------------------------------------------------
 #------------------------------------------------------------------------------------
-# search_f90 function
+# find_refs function
+#
+# Find the cross references in a line of Fortran (which has been converted to lower case).
+# caller is the name of the routine, struct or module the line is in.
+# A reference is appended to refs as [name, kind, line_num, caller] where kind is:
+#   'call'      -> "call <name>" statement. 
+#   'fref'      -> "<name>(". May be a function call (or an array reference).
+#   'use'       -> "use <name>" statement.
+#   'type'      -> "type(<name>)" or "class(<name>)" declaration.
+#   'component' -> "%<name>" type component reference.
+# Except for 'call', only the first reference for a given name, kind and caller is recorded.
+# refs_found is the set used to keep track of this.
+
+re_string     = re.compile(r"'[^']*'|\"[^\"]*\"")
+re_use_stmt   = re.compile(r'use\b\s*(?:,\s*\w+\s*)?(?:::)?\s*(\w+)')
+re_call_stmt  = re.compile(r'(?<!\w)call\s+(\w+)')
+re_fref       = re.compile(r'(?<![%\w])(\w+)\s*\(')
+re_type_ref   = re.compile(r'(?<!\w)(?:type|class)\s*\(\s*(\w+)\s*\)')
+re_component  = re.compile(r'%\s*(\w+)')
+
+fortran_keywords = set(['if', 'type', 'class', 'real', 'integer', 'character', 'logical', 'complex', 'case', 
+                        'allocate', 'deallocate', 'select', 'while', 'where', 'write', 'read', 'print', 'open',
+                        'close', 'inquire', 'format', 'dimension', 'intent', 'kind', 'len', 'procedure', 'forall'])
+
+def find_refs (line2, ix, caller, refs, refs_found):
+
+  code = re_string.sub('', line2).split('!', 1)[0]
+  if code.strip() == '': return
+
+  def add_ref (name, kind):
+    if kind != 'call':
+      if (name, kind, caller) in refs_found: return
+      refs_found.add((name, kind, caller))
+    refs.append([name, kind, ix+1, caller])
+
+  match = re_use_stmt.match(code)
+  if match:
+    add_ref(match.group(1), 'use')
+    return
+
+  for match in re_call_stmt.finditer(code): add_ref(match.group(1), 'call')
+  for match in re_type_ref.finditer(code): add_ref(match.group(1), 'type')
+  for match in re_component.finditer(code): add_ref(match.group(1), 'component')
+  for match in re_fref.finditer(re_call_stmt.sub(' ', code)): 
+    if match.group(1) not in fortran_keywords: add_ref(match.group(1), 'fref')
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# parse_f90 function
+#
+# Parse the text of a Fortran file and return a list of symbol_class instances for the
+# modules, parameters, structs (type and named interface blocks), and routines in the file.
+# The text is the file contents decoded as ISO-8859-1 so character offsets are byte offsets.
+#
+# If refs is a list, the cross references in the file are appended to it. See find_refs.
 
 re_blank_interface_begin = re.compile('interface\s*$')
 re_interface_end         = re.compile('end +interface')
@@ -150,37 +222,53 @@ re_module_begin          = re.compile('module')
 re_module_header_end     = re.compile('contains')
 re_parameter             = re.compile(' parameter\s*::')
 re_parameter1            = re.compile(r'\s*([\$\w]+)\s*(\(.+\)|)?\s*=')  # match to: "charge_of(-3:n_charge$) = "
+re_struct_def            = re.compile(r'(type|interface) +(\w+)\s')
 re_type_interface_end    = re.compile('end +(type|interface)')
 re_end                   = re.compile('end')
 re_routine_name_here     = re.compile('program|subroutine|function|interface')
 
-def search_f90 (file_name, search_com):
+def parse_f90 (text, refs = None):
 
-  re_match_str  = re.compile(search_com.match_str.lower() + '$')
-  re_type_interface_match = re.compile('^(type|interface) +' + search_com.match_str.lower() + '\s') 
+  # Line boundaries
 
-  found_one_in_this_file = False
-  have_printed_file_name = False
+  lines = []
+  ix0 = 0
+  while ix0 < len(text):
+    ix1 = text.find('\n', ix0)
+    if ix1 == -1: ix1 = len(text) - 1
+    lines.append((ix0, ix1+1))
+    ix0 = ix1 + 1
+
+  n_lines = len(lines)
+
+  def line_text (ix):
+    return text[lines[ix][0]:lines[ix][1]]
+
+  def continuation_end (ix):   # End of line ix plus any continuation lines.
+    while line_text(ix).rstrip()[-1:] == '&' and ix+1 < n_lines: ix += 1
+    return lines[ix][1]
+
+  symbols = []
+  module_name = ''
+  refs_found = set()
   in_module_header = False
   in_type_def = False
-  routine_name = ['']
   blank_line_found = False
+  doc_start = -1    # Start of comment block. -1 -> No comments.
+  doc_end = -1
 
-  comments = []
-
-  try:
-    if sys.version_info[0] < 3:
-      f90_file = open(file_name, 'r')
+  def add_symbol (name, kind, ix, def_end):
+    start = lines[ix][0]
+    if doc_start == -1:
+      symbols.append(searchf_index.symbol_class(name, kind, ix+1, start, start, start, def_end))
     else:
-      f90_file = open(file_name, 'r', encoding = 'ISO-8859-1')
-  except:
-    print ('Note: Cannot open: ' + file_name)
-    return
+      symbols.append(searchf_index.symbol_class(name, kind, ix+1, doc_start, doc_end, start, def_end))
 
+  ix = -1
   while True:
-    line = f90_file.readline()
-    if line == '': return
-    line2 = line.lstrip().lower()
+    ix += 1
+    if ix >= n_lines: return symbols
+    line2 = line_text(ix).lstrip().lower()
     if line2.rstrip() == '': 
       blank_line_found = True
       continue
@@ -189,323 +277,717 @@ def search_f90 (file_name, search_com):
 
     if re_blank_interface_begin.match(line2):
       while True:
-        line = f90_file.readline()
-        if line == '': return
-        line2 = line.lstrip().lower()
+        ix += 1
+        if ix >= n_lines: return symbols
+        line2 = line_text(ix).lstrip().lower()
         if re_interface_end.match(line2): break
 
     # Skip "type (" constructs and separator comments.
 
-    if re_type_var.match(line2): continue
+    if re_type_var.match(line2): 
+      if refs is not None and module_name != '': find_refs(line2, ix, module_name, refs, refs_found)
+      continue
     if line2[0] == '#': continue
     if line2[0:10] == '!---------': continue   # ignore separator comment
     if line2[:11] == 'recursive &': 
-      comments.append(line)
+      if doc_start == -1: doc_start = lines[ix][0]
+      doc_end = lines[ix][1]
       continue
 
-
     # In the header section of a module
 
     match = re_module_begin.match(line2)
     if match:
       in_module_header = True
       name_match = re.match('\w+', line2[match.end(0):].lstrip())
-      if name_match and 'module'.startswith(search_com.search_only_for):
+      if name_match: 
+        add_symbol(name_match.group(0), 'module', ix, lines[ix][1])
         module_name = name_match.group(0)
-        if re_match_str.match(module_name):
-          search_com.found_one = True
-          found_one_in_this_file = True
-          if search_com.doc_type == 'LIST':
-            if not have_printed_file_name: search_com.namelist_file.write('\nFile: '  + search_com.file_name_rel_root + '\n')
-            have_printed_file_name = True
-            search_com.namelist_file.write(module_name + '\n')
-          elif search_com.doc_type == 'FULL':
-            print ('\nFile: ', file_name)
-            for com in comments: print (com.rstrip())
-          elif search_com.doc_type == 'SHORT':
-            print ('\nFile: ' + file_name)
-            print ('    ' + line.rstrip())
 
     if not in_type_def and re_module_header_end.match(line2): in_module_header = False
     
-    # Search for parameters
-
-    if in_module_header:
-      if re_parameter.search(line2) and 'parameter'.startswith(search_com.search_only_for):
-        chunks = re_parameter.split(line2)[1].split(',')
-        for chunk in chunks:
-          chunk_match = re_parameter1.match(chunk)
-          if chunk_match:
-            if search_com.doc_type == 'LIST':
-              if not have_printed_file_name: search_com.namelist_file.write('\nFile: '  + search_com.file_name_rel_root + '\n')
-              have_printed_file_name = True
-              search_com.namelist_file.write(chunk_match.group(1) + '\n')
-            elif search_com.doc_type != 'RAW':
-              param = chunk_match.group(1)
-              if re_match_str.match(param) or \
-                 (param[-1] == '$' and re_match_str.match(param[:-1])):
-                search_com.found_one = True
-                found_one_in_this_file = True
-                if not have_printed_file_name:
-                  print ('\nFile: ' + file_name)
-                  have_printed_file_name = True
-                print ('    ' + line.rstrip())
-                while line.rstrip()[-1] == '&':
-                  line = f90_file.readline()
-                  print ('    ' + line.rstrip())                
-                break
+    # Parameters
+
+    if in_module_header and re_parameter.search(line2):
+      chunks = re_parameter.split(line2)[1].split(',')
+      for chunk in chunks:
+        chunk_match = re_parameter1.match(chunk)
+        if chunk_match: add_symbol(chunk_match.group(1), 'parameter', ix, continuation_end(ix))
 
     # Add to comment block if a comment
 
     if line2[0] == '!':
-      if blank_line_found:
-        comments = []
+      if blank_line_found or doc_start == -1:
+        doc_start = lines[ix][0]
         blank_line_found = False
-      if search_com.doc_type == 'FULL': comments.append(line)
+      doc_end = lines[ix][1]
       continue
 
-    # Match to type or interface statement
-    # These we type the whole definition
+    # Type or interface block. The whole block is the definition.
 
     if in_type_def and re_type_def_end.match(line2): in_type_def = False
     if not in_type_def and re_type_def.match(line2): in_type_def = True
 
-    match = re_type_interface_match.match(line2)
-    if match and 'struct'.startswith(search_com.search_only_for):
-      search_com.found_one = True
-      found_one_in_this_file = True
-
-      if search_com.doc_type == 'LIST':
-        if not have_printed_file_name: search_com.namelist_file.write('\nFile: '  + search_com.file_name_rel_root + '\n')
-        have_printed_file_name = True
-        search_com.namelist_file.write(match.group(2) + '\n')
-      elif search_com.doc_type == 'FULL':
-        print ('\nFile: ' + file_name)
-        for com in comments: print (com.rstrip())
-        if len(comments) > 0: print ('')
-        print (line.rstrip())
-        while True:
-          line = f90_file.readline()
-          if line == '': return
-          line2 = line.lstrip().lower()
-          print (line.rstrip())
-          if re_type_interface_end.match(line2): break
-          in_type_def = False
-      elif search_com.doc_type == 'SHORT':
-        print ('\nFile: ' + file_name)
-        print ('    ' + line.rstrip())
-      elif search_com.doc_type == 'RAW':
-        while True:
-          line = f90_file.readline()
-          if line == '': return
-          line2 = line.lstrip().lower()
-          if re_type_interface_end.match(line2): break
-          print (line.rstrip())
-          in_type_def = False
-
-      comments = []
+    match = re_struct_def.match(line2)
+    if match:
+      ix_end = ix
+      while ix_end+1 < n_lines:
+        ix_end += 1
+        line2 = line_text(ix_end).lstrip().lower()
+        if re_type_interface_end.match(line2): break
+        if refs is not None: find_refs(line2, ix_end, match.group(2), refs, refs_found)
+      if match.group(1) == 'type':
+        add_symbol(match.group(2), 'struct', ix, lines[ix_end][1])
+      else:
+        add_symbol(match.group(2), 'interface', ix, lines[ix_end][1])
+      ix = ix_end
+      in_type_def = False
+      doc_start = -1
       continue
 
-    # match to subroutine, function, etc.
+    # Subroutine, function, etc.
 
+    routine_name = ['']
     if routine_here(line2, routine_name):
-      if re_match_str.match(routine_name[0]) and 'routine'.startswith(search_com.search_only_for):
-        search_com.found_one = True
-        found_one_in_this_file = True
-        if search_com.doc_type == 'LIST':
-          if not have_printed_file_name: search_com.namelist_file.write('\nFile: '  + search_com.file_name_rel_root + '\n')
-          have_printed_file_name = True
-          search_com.namelist_file.write(routine_name[0] + '\n')
-        elif search_com.doc_type == 'FULL':
-          print ('\nFile: ' + file_name)
-          for com in comments: print (com.rstrip())
-          while True:
-            print (line.rstrip())
-            if line.rstrip()[-1] != '&': break
-            line = f90_file.readline()
-        else:
-          print ('\nFile: ' + file_name)
-          print ('    ' + line.rstrip())
+      if routine_name[0] != '': add_symbol(routine_name[0], 'routine', ix, continuation_end(ix))
+      callers = [routine_name[0]]    # Routine and contained routine names.
 
       # Skip rest of routine including contained routines
 
       count = 1
       while True:
-        line = f90_file.readline()
-        if line == '': return
-        line2 = line.lstrip().lower()
+        ix += 1
+        if ix >= n_lines: return symbols
+        line2 = line_text(ix).lstrip().lower()
 
         if re_end.match(line2):
           if re_routine_name_here.match(line2[4:].lstrip()):
             count -= 1
+            if len(callers) > 1: callers.pop()
         elif routine_here(line2, routine_name):
             count += 1
+            callers.append(routine_name[0])
+        elif refs is not None and callers[-1] != '':
+          find_refs(line2, ix, callers[-1], refs, refs_found)
 
         if count == 0: break
 
+    elif refs is not None and module_name != '':
+      find_refs(line2, ix, module_name, refs, refs_found)
+
     #
 
-    comments = []
+    doc_start = -1
 
 #------------------------------------------------------------------------------------
 #------------------------------------------------------------------------------------
-# search_c function
+# print_f90_symbols function
+#
+# Print the symbols that match the search.
+# read_text(start, end) returns the text of the file between the given offsets.
 
-re_quote            = re.compile('"|\'')
+def span_lines (text):
+  lines = text.split('\n')
+  if lines[-1] == '': del lines[-1]
+  return lines
 
-def search_c (file_name, search_com):
+def print_f90_symbols (file_name, symbols, read_text, search_com):
 
-  found_one_in_this_file = False
-  in_extended_comment = False
-  blank_line_here = False
-  n_curly = 0
-  comments = []
-  lines_after_comments = []
-  function_line = ''
+  re_match_str = re.compile(search_com.match_str.lower() + '$')
+  doc_type = search_com.doc_type
   have_printed_file_name = False
+  param_line_printed = -1
 
-  c_file = open(file_name)
-  while True:
-    try:
-      line = c_file.readline()
-    except:
-      continue    # If line contains a non-ascii character.
-    if line == '': return
-    line2 = line.lstrip()
-    if line2.rstrip() == '':
-      blank_line_here = True
+  for sym in symbols:
+    kind = sym.kind
+    if kind == 'interface':   # A named interface block is a struct unless searching only for routines.
+      if 'struct'.startswith(search_com.search_only_for):
+        kind = 'struct'
+      else:
+        kind = 'routine'
+    if not kind.startswith(search_com.search_only_for): continue
+
+    name = sym.name
+    if not re_match_str.match(name) and \
+         not (kind == 'parameter' and name[-1] == '$' and re_match_str.match(name[:-1])): continue
+
+    # Parameter. Print the line (and continuation lines) only once.
+
+    if kind == 'parameter':
+      if doc_type == 'RAW': continue
+      search_com.found_one = True
+      if sym.def_start == param_line_printed: continue
+      param_line_printed = sym.def_start
+      if not have_printed_file_name:
+        print ('\nFile: ' + file_name)
+        have_printed_file_name = True
+      for line in span_lines(read_text(sym.def_start, sym.def_end)): print ('    ' + line.rstrip())
       continue
 
-    # Ignore preprocessor lines
+    search_com.found_one = True
+    def_lines = span_lines(read_text(sym.def_start, sym.def_end))
 
-    if line[0] == '#': continue
+    comments = []
+    if doc_type == 'FULL':
+      for line in span_lines(read_text(sym.doc_start, sym.doc_end)):
+        line2 = line.lstrip().lower()
+        if (line2[0:1] == '!' and line2[0:10] != '!---------') or line2[:11] == 'recursive &': comments.append(line)
 
-    # Throw out quoted substrings
+    if kind == 'module':
+      if doc_type == 'FULL':
+        print ('\nFile: ', file_name)
+        for com in comments: print (com.rstrip())
+      elif doc_type == 'SHORT':
+        print ('\nFile: ' + file_name)
+        print ('    ' + def_lines[0].rstrip())
 
-    line2.replace(r'\"', '').replace(r"\'", '')
-    while True:
-      match = re_quote.search(line2)
-      if not match: break
-      char = match.group(0)      
-      ix = line2.find(char, match.end(0))
-      if ix == -1: break
-      line2 = line2[0:match.start(0)] + line2[ix+1:]
-
-    # Look For multiline comment "/* ... */" construct and remove if present.
-
-    if n_curly == 0:
-      if line2[0:2] == '//' or line2[0:2] == '/*' or in_extended_comment: 
-        if blank_line_here:
-          comments = []
-          blank_line_here = False
-        comments.append(line)
-        lines_after_comments = []
+    elif kind == 'struct':
+      if doc_type == 'FULL':
+        print ('\nFile: ' + file_name)
+        for com in comments: print (com.rstrip())
+        if len(comments) > 0: print ('')
+        for line in def_lines: print (line.rstrip())
+      elif doc_type == 'SHORT':
+        print ('\nFile: ' + file_name)
+        print ('    ' + def_lines[0].rstrip())
+      elif doc_type == 'RAW':
+        if re_type_interface_end.match(def_lines[-1].lstrip().lower()): del def_lines[-1]
+        for line in def_lines[1:]: print (line.rstrip())
+
+    else:
+      print ('\nFile: ' + file_name)
+      if doc_type == 'FULL':
+        for com in comments: print (com.rstrip())
+        for line in def_lines: print (line.rstrip())
       else:
-        lines_after_comments.append(line)
+        print ('    ' + def_lines[0].rstrip())
 
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# search_f90 function
+#
+# Parse a Fortran file and print matches. Nothing is printed for doc_type = 'LIST'.
+# Returns [symbols, refs] where symbols is the list of symbols in the file and refs is
+# the list of cross references (only found for doc_type = 'LIST').
 
-    while True:
-      ix_save = 0
-      if in_extended_comment:
-        ix = line2.find('*/')
-        if ix == -1: break
-        in_extended_comment = False
-        line2 = line2[0:ix_save] + line2[ix+2:]
-      else:
-        ix = line2.find('/*')
-        if ix == -1: break
-        in_extended_comment = True
-        ix_save = ix
+def read_source (file_name):
+  try:
+    with open(file_name, 'rb') as src_file:
+      return src_file.read().decode('ISO-8859-1')
+  except:
+    print ('Note: Cannot open: ' + file_name)
+    return None
 
-    if line2[0:2] == '//': continue
-    if line2.strip() == '': continue
+def search_f90 (file_name, search_com):
 
-    ix = line2.find('//')
-    if ix > -1: line2 = line2[0:ix]
+  text = read_source(file_name)
+  if text is None: return [[], []]
 
-    # Count curly brackets
+  if search_com.doc_type == 'LIST':
+    refs = []
+    symbols = parse_f90(text, refs)
+    return [symbols, refs]
+
+  symbols = parse_f90(text)
+  print_f90_symbols(file_name, symbols, lambda start, end: text[start:end], search_com)
+  return [symbols, []]
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# parse_c function
+#
+# Parse the text of a C/C++ file and return the list of symbols (searchf_index.symbol_class) found:
+#   'routine'   Function definitions (that is, with a body). Includes methods defined in a class body.
+#   'struct'    Class, struct and union definitions.
+# Names are stored lower case. A "Class::" qualifier of a method name is dropped.
+#
+# The text is split into tokens so comments, strings and preprocessor lines are skipped and
+# declarations that span multiple lines are handled. Namespace and extern "C" blocks are searched.
+# The doc span is the comment block before the definition. The def span of a routine is the
+# declaration up to the line with the opening "{" and the def span of a struct is the entire definition.
+
+re_c_token = re.compile(r'''
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<pp>(?<![^\n])[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<string>"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?)
+  | (?P<name>~?[A-Za-z_]\w*(?:\s*::\s*~?[A-Za-z_]\w*)*)
+  | (?P<newline>\n)
+  | (?P<space>[ \t\r\f\v]+)
+  | (?P<punct>.)
+''', re.S | re.X)
+
+c_access_specifiers = set(['public', 'private', 'protected'])
+
+def parse_c (text):
+
+  symbols = []
+  frames = []          # Stack of open scopes (namespace, extern "C", class). Struct symbol or None.
+  decl = []            # Tokens, [type, value], of the current declaration.
+  decl_start = -1
+  doc_start = -1
+  doc_end = -1
+  n_newline = 0        # Number of newlines since the last token.
+  skip_depth = 0       # Brace depth within a function body or initializer being skipped.
+  line_pos = 0
+  line_num = 1
+
+  def line_start (pos):
+    return text.rfind('\n', 0, pos) + 1
+
+  def line_end (pos):
+    ix = text.find('\n', pos)
+    if ix == -1: return len(text)
+    return ix + 1
+
+  for match in re_c_token.finditer(text):
+    typ = match.lastgroup
+    if typ == 'space': continue
+    if typ == 'newline':
+      n_newline += 1
+      continue
+    value = match.group(0)
+    pos = match.start()
 
-    for char in line2:
+    # Skip function body
+
+    if skip_depth > 0:
+      if typ == 'punct':
+        if value == '{': skip_depth += 1
+        elif value == '}': skip_depth -= 1
+      n_newline = 0
+      continue
+
+    if typ == 'pp':
+      n_newline = 0
+      continue
+
+    # A comment block starts after a blank line. Comments after code on the same line are ignored.
+
+    if typ == 'comment':
+      if len(decl) == 0 and text[line_start(pos):pos].strip() == '':
+        if doc_start < 0 or n_newline > 1: doc_start = line_start(pos)
+        doc_end = line_end(match.end() - 1)
+      n_newline = 0
+      continue
+
+    n_newline = 0
+
+    if typ == 'punct' and value in ';{}:':
+
+      if value == ':' and not (len(decl) == 1 and decl[0][1] in c_access_specifiers):
+        decl.append([typ, value])
+        continue
 
-      if n_curly == 0: 
-        function_line = function_line + char
-        if char == ';': 
-          function_line = ''
-          comments = []
-          lines_after_comments = []
+      if value == '}':
+        if len(frames) > 0:
+          sym = frames.pop()
+          if sym is not None: sym.def_end = line_end(pos)
+
+      elif value == '{':
+        if len(decl) == 0:
+          skip_depth = 1
+        elif decl[0][1] == 'namespace' or (decl[0][1] == 'extern' and len(decl) == 2 and decl[1][0] == 'string'):
+          frames.append(None)
+
+        else:
+          line_num += text.count('\n', line_pos, decl_start)
+          line_pos = decl_start
+          if doc_start < 0:
+            doc_start = line_start(decl_start)
+            doc_end = doc_start
+
+          # Find the first "(" and the last class/struct/union keyword outside of template brackets.
+          n_angle = 0
+          ix_paren = -1
+          ix_key = -1
+          has_equal = False
+          for ix, (t, v) in enumerate(decl):
+            if t == 'punct':
+              if v == '<': n_angle += 1
+              elif v == '>' and n_angle > 0: n_angle -= 1
+              elif v == '=' and ix_paren == -1: has_equal = True
+              elif v == '(' and n_angle == 0 and ix_paren == -1: ix_paren = ix
+            elif t == 'name' and n_angle == 0 and ix_paren == -1:
+              if v in ('class', 'struct', 'union', 'enum'): ix_key = ix
+
+          if ix_paren > 0 and not has_equal and decl[ix_paren-1][0] == 'name':
+            name = re.split(r'\s*::\s*', decl[ix_paren-1][1])[-1].lower()
+            symbols.append(searchf_index.symbol_class(name, 'routine', line_num, doc_start, doc_end, line_start(decl_start), line_end(pos)))
+            skip_depth = 1
+
+          elif ix_paren == -1 and not has_equal and ix_key > -1 and decl[ix_key][1] != 'enum':
+            sym = None
+            if ix_key+1 < len(decl) and decl[ix_key+1][0] == 'name':
+              name = re.split(r'\s*::\s*', decl[ix_key+1][1])[-1].lower()
+              sym = searchf_index.symbol_class(name, 'struct', line_num, doc_start, doc_end, line_start(decl_start), len(text))
+              symbols.append(sym)
+            frames.append(sym)
 
-      if char == '{':
-        n_curly += 1
-        if n_curly == 1:
-          if search_com.case_sensitive:
-            is_match = re.search(' ' + search_com.match_str + '_?\s*(\(.*\))\s*{', function_line)
           else:
-            is_match = re.search(' ' + search_com.match_str + '_?\s*(\(.*\))\s*{', function_line, re.I)
-          if is_match and 'routine'.startswith(search_com.search_only_for):
-            search_com.found_one = True
-            if search_com.doc_type == 'LIST':
-              if not have_printed_file_name: search_com.namelist_file.write('\nFile: '  + search_com.file_name_rel_root + '\n')
-              have_printed_file_name = True
-              search_com.namelist_file.write(is_match.group(1) + '\n')
-            elif search_com.doc_type == 'FULL':
-              print ('\nFile: ' + file_name)
-              for com in comments: print (com.rstrip())
-              for com in lines_after_comments: print (com.rstrip())
-            else:
-              if not found_one_in_this_file: 
-                print ('\nFile: ' + file_name)
-                found_one_in_this_file = True
-              for com in lines_after_comments: print ('    ' + com.rstrip())
-
-      elif char == '}':
-        n_curly -= 1
-        if n_curly == 0: 
-          function_line = ''
-          comments = []
-          lines_after_comments = []
-  return
+            skip_depth = 1
+
+      decl = []
+      doc_start = -1
+      continue
+
+    if len(decl) == 0: decl_start = pos
+    decl.append([typ, value])
+
+  return symbols
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# print_c_symbols function
+#
+# Print the C/C++ symbols that match the search.
+# read_text(start, end) returns the text of the file between the given offsets.
+# With doc_type = 'SHORT' the file name is only printed once.
+
+def print_c_symbols (file_name, symbols, read_text, search_com):
+
+  re_match_str = re.compile(search_com.match_str.lower() + '_?$')
+  doc_type = search_com.doc_type
+  have_printed_file_name = False
+
+  for sym in symbols:
+    if not sym.kind.startswith(search_com.search_only_for): continue
+    if not re_match_str.match(sym.name): continue
+
+    def_text = read_text(sym.def_start, sym.def_end)
+    if search_com.case_sensitive and not re.search(r'(?<!\w)' + search_com.match_str + r'_?(?!\w)', def_text): continue
+    search_com.found_one = True
+
+    # Blank and preprocessor lines are not printed.
+    def_lines = [line for line in span_lines(def_text) if line.strip() != '' and line[0:1] != '#']
+    if sym.kind == 'struct' and doc_type != 'FULL':
+      for ix, line in enumerate(def_lines):
+        if '{' in line: break
+      del def_lines[ix+1:]
+
+    if doc_type == 'FULL':
+      print ('\nFile: ' + file_name)
+      for line in span_lines(read_text(sym.doc_start, sym.doc_end)):
+        if line.strip() != '' and line[0:1] != '#': print (line.rstrip())
+      for line in def_lines: print (line.rstrip())
+    else:
+      if not have_printed_file_name:
+        print ('\nFile: ' + file_name)
+        have_printed_file_name = True
+      for line in def_lines: print ('    ' + line.rstrip())
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# search_c function
+#
+# Parse a C/C++ file and print matches. Returns [symbols, []]. See search_f90.
+
+def search_c (file_name, search_com):
+
+  text = read_source(file_name)
+  if text is None: return [[], []]
+
+  symbols = parse_c(text)
+  if search_com.doc_type != 'LIST':
+    print_c_symbols(file_name, symbols, lambda start, end: text[start:end], search_com)
+  return [symbols, []]
 
 #------------------------------------------------------------------------------------
 #------------------------------------------------------------------------------------
 # search_file function
+#
+# Search a file. Returns [symbols, refs]. See search_f90.
+
+def file_lang (file_name):
+  if file_name[-4:] == '.f90' or file_name[-4:] == '.inc': return 'f90'
+  if file_name[-4:] in ('.cpp', '.hpp') or file_name[-2:] in ('.h', '.c'): return 'c'
+  return ''
+
+def parse_source (text, lang, refs = None):
+  if lang == 'f90': return parse_f90(text, refs)
+  return parse_c(text)
 
 def search_file (search_base_dir, file_dir, file_name, search_com):
-  if re.search ('#', file_name): return
-  if file_name[0] == '.': return
+  if re.search ('#', file_name): return [[], []]
+  if file_name[0] == '.': return [[], []]
   full_file_name = os.path.join(file_dir, file_name)
   search_com.file_name_rel_root = full_file_name.replace(search_base_dir, '', 1)
-  if file_name[-4:] == '.f90' or file_name[-4:] == '.inc': search_f90(full_file_name, search_com)
-  if file_name[-4:] == '.cpp' or file_name[-2:] == '.h' or file_name[-2:] == '.c': search_c(full_file_name, search_com)
+  lang = file_lang(file_name)
+  if lang == 'f90': return search_f90(full_file_name, search_com)
+  if lang == 'c': return search_c(full_file_name, search_com)
+  return [[], []]
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# search_files function
+#
+# Search a list of files. Each task in the list is [search_base_dir, file_dir, file_name].
+# This is a generator that returns the search_file result, [symbols, refs], for each file.
+# If pool is not None, the files are searched in parallel. The output of each file is captured
+# and printed in the order of the tasks so the output is the same as a serial search.
+
+def search_file_worker (task):
+  search_base_dir, file_dir, file_name, search_com = task
+  search_com.found_one = False
+  stdout = sys.stdout
+  sys.stdout = io.StringIO()
+  try:
+    result = search_file(search_base_dir, file_dir, file_name, search_com)
+    output = sys.stdout.getvalue()
+  finally:
+    sys.stdout = stdout
+  return [output, search_com.found_one, result]
+
+def search_files (tasks, search_com, pool = None):
+
+  if pool is None or len(tasks) < 2:
+    for task in tasks:
+      yield search_file(task[0], task[1], task[2], search_com)
+    return
+
+  chunk_size = max(1, min(8, len(tasks) // (4 * search_com.num_jobs)))
+  for output, found_one, result in pool.imap(search_file_worker, [task + [search_com] for task in tasks], chunk_size):
+    sys.stdout.write(output)
+    sys.stdout.flush()
+    if found_one: search_com.found_one = True
+    yield result
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# source_files function
+#
+# Return list of [file_dir, file_name] for all files in the directory tree, in sorted order.
+# Hidden directories plus "production" and "debug" directories are not included.
+# The order is that of walk_order_key: In each directory, the files come first followed by the subdirectories.
+
+def source_files (search_base_dir):
+
+  file_list = []
+
+  for this_search_base_dir, sub_dirs, files in os.walk(search_base_dir):
+
+    # Remove from searching hidden directories plus "production" and "debug" derectories
+    i = 0
+    while i < len(sub_dirs):
+      if sub_dirs[i] == 'production' or sub_dirs[i] == 'debug' or sub_dirs[i][0] == '.': 
+        del sub_dirs[i]
+      else:
+        i += 1
+    sub_dirs.sort()     # So the order does not depend upon the file system.
+
+    for this_file in sorted(files): file_list.append([this_search_base_dir, this_file])
+
+  return file_list
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# walk_order_key function
+#
+# Sort key for a file path, relative to the root search directory, giving the order of source_files.
+# Searches list matches in this order whether or not a searchf.index or searchf.namelist file is used.
+
+def walk_order_key (path):
+  parts = path.split('/')
+  return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# update_index function
+#
+# Create or update the searchf.index and searchf.namelist files of a root search directory.
+# If there is an existing index, only files that are new or whose contents have changed are parsed.
+# A file whose modification time or size has changed is hashed to see if the contents have changed.
+# The new files are written under temporary names and then renamed so getf/listf never see
+# a partially written file.
+
+def update_index (search_base_dir, search_com, pool = None):
+
+  namelist_file = search_base_dir + 'searchf.namelist'
+  index_file = search_base_dir + 'searchf.index'
+
+  if not os.access(search_base_dir, os.W_OK):
+    print ('CANNOT WRITE TO: ' + namelist_file)
+    return
+
+  old_index = searchf_index.open_index(index_file)
+  if old_index is None:
+    print ('Creating: ' + index_file)
+    old_files = {}
+  else:
+    print ('Updating: ' + index_file)
+    old_files = old_index.file_info()
+
+  if os.path.isfile(index_file + '.tmp'): os.remove(index_file + '.tmp')
+  index = searchf_index.symbol_index_class(index_file + '.tmp')
+  index.create()
+
+  # Find which files need to be parsed.
+
+  file_list = []   # [path, lang, stat, sha, old]
+  parse_tasks = []
+
+  for file_dir, file_name in source_files(search_base_dir):
+    if re.search ('#', file_name) or file_name[0] == '.': continue
+    lang = file_lang(file_name)
+    if lang == '': continue
+
+    full_file_name = os.path.join(file_dir, file_name)
+    path = full_file_name.replace(search_base_dir, '', 1)
+    old = old_files.get(path)       # [file_ix, lang, mtime, size, hash] or None
+    if old is not None and old[1] != lang: old = None
+
+    try:
+      stat = os.stat(full_file_name)
+      if old is not None and old[2] == stat.st_mtime and old[3] == stat.st_size:
+        sha = old[4]
+      else:
+        sha = searchf_index.file_hash(full_file_name)
+    except (OSError, IOError):
+      continue
+
+    if old is not None and old[4] != sha: old = None
+    if old is None: parse_tasks.append([search_base_dir, file_dir, file_name])
+    file_list.append([path, lang, stat, sha, old])
+
+  # Parse and write the new index and namelist.
+
+  parsed = search_files(parse_tasks, search_com, pool)
+  f_namelist = open(namelist_file + '.tmp', 'w')
+
+  for path, lang, stat, sha, old in file_list:
+    if old is None:
+      symbols, refs = next(parsed)
+    else:
+      symbols = old_index.file_symbols(old[0])
+      refs = old_index.file_refs(old[0])
+
+    index.add_file(path, lang, stat.st_mtime, stat.st_size, sha, symbols, refs)
+
+    if len(symbols) > 0:
+      f_namelist.write('\nFile: '  + path + '\n')
+      for sym in symbols: f_namelist.write(sym.name + '\n')
+
+  n_removed = len(set(old_files) - set(index.file_info()))
+
+  f_namelist.close()
+  index.create_name_index()
+  index.close()
+  if old_index is not None: old_index.close()
+
+  os.replace(index_file + '.tmp', index_file)
+  os.replace(namelist_file + '.tmp', namelist_file)
+  print ('  Files parsed: ' + str(len(parse_tasks)) + '  Unchanged: ' + str(len(file_list) - len(parse_tasks)) + '  Removed: ' + str(n_removed))
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# search_index function
+#
+# Search using the searchf.index file. Only the files that have a matching symbol are read and,
+# for these, only the comment block and definition of the symbol.
+#
+# files is the index.files() dict. If None, this is obtained from the index.
+# changed is a dict of file_ix -> list of symbols for the files that have been modified since the index was 
+# made (None for deleted files). This is kept up to date by searchf_server.
+# If changed is None (no server), only the files with a matching symbol are checked and, if modified, parsed
+# in full. Matches in other modified files are not found until the index is updated.
+
+def print_file_symbols (file_name, lang, symbols, search_com):
+  with open(file_name, 'rb') as src_file:
+    def read_text(start, end):
+      src_file.seek(start)
+      return src_file.read(end - start).decode('ISO-8859-1')
+    if lang == 'f90':
+      print_f90_symbols(file_name, symbols, read_text, search_com)
+    else:
+      print_c_symbols(file_name, symbols, read_text, search_com)
+
+def search_index (search_base_dir, index, search_com, files = None, changed = None):
+
+  regex = search_com.match_str.lower()
+  symbols = index.lookup(regex, re.compile(regex + '_?$'))
+  file_symbols = {}
+  for sym in symbols:
+    file_symbols.setdefault(sym.file_ix, []).append(sym)
+
+  if files is None: files = index.files()
+  check_files = (changed is None)
+  if changed is None: changed = {}
+
+  for file_ix in sorted(set(file_symbols) | set(changed), key = lambda ix: walk_order_key(files[ix][0])):
+    path, lang, mtime, size = files[file_ix]
+    full_file_name = search_base_dir + path
+    search_com.file_name_rel_root = path
+
+    if file_ix in changed:
+      if changed[file_ix] is not None: print_file_symbols(full_file_name, lang, changed[file_ix], search_com)
+      continue
+
+    if check_files:
+      try:
+        stat = os.stat(full_file_name)
+      except OSError:
+        continue   # File has been deleted.
+
+      if stat.st_mtime != mtime or stat.st_size != size:
+        if lang == 'f90':
+          search_f90(full_file_name, search_com)
+        else:
+          search_c(full_file_name, search_com)
+        continue
+
+    print_file_symbols(full_file_name, lang, file_symbols[file_ix], search_com)
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# has_index function
+#
+# Return True if a search directory has a valid searchf.index file (or is '', not found by choose_path).
+
+def has_index (search_base_dir):
+  if search_base_dir == '': return True
+  index = searchf_index.open_index(os.path.join(search_base_dir, 'searchf.index'))
+  if index is None: return False
+  index.close()
+  return True
 
 #------------------------------------------------------------------------------------
 #------------------------------------------------------------------------------------
 # search_tree function
 
-def search_tree (search_base_dir, search_com):
+def search_tree (search_base_dir, search_com, pool = None):
 
   if search_base_dir == '': return    # Directory not found by choose_path
   if search_base_dir[-1] != '/': search_base_dir = search_base_dir + '/'
   namelist_file = search_base_dir + 'searchf.namelist'
-
-  # Open file for namelist output if needed
+  index_file = search_base_dir + 'searchf.index'
 
   if search_com.doc_type == 'LIST':
-    if os.access(search_base_dir, os.W_OK):
-      print ('Creating: ' + namelist_file)
-      search_com.namelist_file = open(namelist_file, 'w')
-    else:
-      print ('CANNOT WRITE TO: ' + namelist_file)
+    update_index(search_base_dir, search_com, pool)
+    return
+
+  # If there is an existing searchf.index file then use this.
+
+  if index_cache is not None:
+    cached = index_cache.get(search_base_dir)
+    if cached is not None:
+      search_index(search_base_dir, cached.index, search_com, cached.files, cached.changed)
       return
 
+  index = searchf_index.open_index(index_file)
+  if index is not None:
+    search_index(search_base_dir, index, search_com)
+    index.close()
+    return
+
   # If there is an existing searchf.namelist file then use this to see if there are matches.
 
-  if search_com.doc_type != 'LIST' and os.path.isfile(namelist_file):
+  if os.path.isfile(namelist_file):
 
     f_namelist = open(namelist_file)
     have_searched_file = False
+    tasks = []
 
     for line in f_namelist:
-      if line == '': return
+      if line == '': break
       if line.strip() == '': continue
 
       if line[0:5] == 'File:':
@@ -522,30 +1004,206 @@ def search_tree (search_base_dir, search_com):
         continue
 
       if re.search(search_com.match_str, line):
-        search_file (search_base_dir, this_search_base_dir, this_file, search_com)
+        tasks.append([search_base_dir, this_search_base_dir, this_file])
         have_searched_file = True
 
+    tasks.sort(key = lambda task: walk_order_key(os.path.relpath(os.path.join(task[1], task[2]), search_base_dir)))
+    for symbols in search_files(tasks, search_com, pool): pass
     return
 
   # No searchf.namelist: Loop over all directories
 
-  for this_search_base_dir, sub_dirs, files in os.walk(search_base_dir):
+  tasks = [[search_base_dir, file_dir, file_name] for file_dir, file_name in source_files(search_base_dir)]
+  for symbols in search_files(tasks, search_com, pool): pass
 
-    # Remove from searching hidden directories plus "production" and "debug" derectories
-    i = 0
-    while i < len(sub_dirs):
-      if sub_dirs[i] == 'production' or sub_dirs[i] == 'debug' or sub_dirs[i][0] == '.': 
-        del sub_dirs[i]
+  return
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# symbol_names function
+#
+# Return dict of name -> list of [kind, file_name] for all names in a root search directory.
+# The names are taken from searchf.index or, if there is no index, from searchf.namelist.
+# If neither exists an empty dict is returned.
+
+def symbol_names (search_base_dir):
+
+  if search_base_dir == '': return {}
+  if search_base_dir[-1] != '/': search_base_dir = search_base_dir + '/'
+
+  name_dict = {}
+  cached = None
+  if index_cache is not None: cached = index_cache.get(search_base_dir)
+
+  if cached is not None:
+    index = cached.index
+  else:
+    index = searchf_index.open_index(search_base_dir + 'searchf.index')
+
+  if index is not None:
+    for name, defs in index.name_files().items():
+      name_dict[name] = [[kind, search_base_dir + path] for kind, path in defs]
+    if cached is None: index.close()
+
+  elif os.path.isfile(search_base_dir + 'searchf.namelist'):
+    for line in open(search_base_dir + 'searchf.namelist'):
+      line = line.strip()
+      if line == '': continue
+      if line[0:5] == 'File:':
+        file_name = search_base_dir + line[6:].strip()
+        continue
+      if line[-1] == '$': line = line[:-1]
+      name_dict.setdefault(line.lower(), []).append(['', file_name])
+
+  return name_dict
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# fuzzy_search function
+#
+# Print names within an edit distance of max_dist of match_str. Closest names are printed first.
+# For short names, max_dist is reduced (one edit per three characters) since otherwise almost 
+# any short name would match. Returns the number of names printed.
+
+def fuzzy_search (dir_list, match_str, max_dist = 2, max_print = 20, indent = '    '):
+
+  max_dist = min(max_dist, len(match_str) // 3)
+  if max_dist == 0: return 0
+
+  name_dict = {}
+  for dir in dir_list:
+    for name, defs in symbol_names(dir).items():
+      name_dict.setdefault(name, []).extend(defs)
+
+  matches = searchf_index.fuzzy_match(match_str.lower(), sorted(name_dict), max_dist)
+
+  for dist, name in matches[:max_print]:
+    for kind, file_name in name_dict[name]:
+      if kind == '':
+        print (indent + name.ljust(40) + file_name)
       else:
-        i += 1
+        print (indent + name.ljust(40) + (kind + ':').ljust(12) + file_name)
 
-    # Now loop over all files
+  return min(len(matches), max_print)
 
-    for this_file in files: search_file (search_base_dir, this_search_base_dir, this_file, search_com)
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# refs_search function
+#
+# Print the cross references to and from names matching match_str using the searchf.index files.
+# Returns True if any references were found.
 
-  # End
+refs_to_headers   = [[['call', 'fref'], 'Called by:'], [['use'], 'Used by:'], 
+                     [['type'], 'Declared as a type in:'], [['component'], 'Referenced as a type component in:']]
+refs_from_headers = [[['call', 'fref'], 'Calls:'], [['use'], 'Uses:'], [['type'], 'Declares types:']]
 
-  return
+def refs_search (dir_list, search_com):
+
+  regex = search_com.match_str.lower()
+  re_match = re.compile(regex + '$')
+  refs_to = []
+  refs_from = []
+
+  for search_base_dir in dir_list:
+    if search_base_dir == '': continue
+    if search_base_dir[-1] != '/': search_base_dir = search_base_dir + '/'
+
+    cached = None
+    if index_cache is not None: cached = index_cache.get(search_base_dir)
+    if cached is not None:
+      index = cached.index
+    else:
+      index = searchf_index.open_index(search_base_dir + 'searchf.index')
+    if index is None:
+      print ('Note: No searchf.index in: ' + search_base_dir + '  (Use create_searchf_namelist to create.)')
+      continue
+
+    for name, kind, path, line, caller in index.cross_refs(regex, re_match, True):
+      refs_to.append([name, kind, search_base_dir + path + ':' + str(line), caller])
+    for name, kind, path, line, caller in index.cross_refs(regex, re_match, False):
+      refs_from.append([name, kind, search_base_dir + path + ':' + str(line), caller])
+    if cached is None: index.close()
+
+  # Print. For references from a name, only the first reference to a given name is printed.
+
+  for kinds, header in refs_to_headers:
+    these = [ref for ref in refs_to if ref[1] in kinds]
+    if len(these) == 0: continue
+    print ('\n' + header)
+    for name, kind, where, caller in these:
+      if name == regex:
+        print ('    ' + caller.ljust(40) + where)
+      else:
+        print ('    ' + (caller + ' -> ' + name).ljust(40) + where)
+
+  for kinds, header in refs_from_headers:
+    these = []
+    names = set()
+    for ref in refs_from:
+      if ref[1] not in kinds or (ref[3], ref[0]) in names: continue
+      names.add((ref[3], ref[0]))
+      these.append(ref)
+    if len(these) == 0: continue
+    print ('\n' + header)
+    for name, kind, where, caller in these:
+      if caller == regex:
+        print ('    ' + name.ljust(40) + where)
+      else:
+        print ('    ' + (caller + ' -> ' + name).ljust(40) + where)
+
+  return len(refs_to) + len(refs_from) > 0
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# server_socket_file function
+#
+# Name of the Unix socket file used by searchf_server.
+
+def server_socket_file ():
+  if 'SEARCHF_SOCKET' in os.environ: return os.environ['SEARCHF_SOCKET']
+  return os.path.join(tempfile.gettempdir(), 'searchf-' + str(os.getuid()) + '.sock')
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# query_server function
+#
+# Send the query (the command line arguments) to searchf_server and return the output.
+# Returns None if there is no server running or the server cannot be connected to. In this case the
+# search is done locally. Once the query has been sent, the search is not redone locally if the server
+# does not answer (that would do the search twice) and an error message is returned instead.
+
+def query_server (doc_type):
+
+  socket_file = server_socket_file()
+  if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_file): return None
+
+  request = {'doc_type': doc_type, 'argv': sys.argv, 'cwd': os.getcwd(), 'release_dir': release_dir, 'dist_dir': dist_dir}
+
+  try:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(10)
+    sock.connect(socket_file)
+  except (socket.error, OSError):
+    return None
+
+  try:
+    sock.sendall((json.dumps(request) + '\n').encode())
+    sock.shutdown(socket.SHUT_WR)
+    sock.settimeout(60)
+    chunks = []
+    while True:
+      chunk = sock.recv(65536)
+      if not chunk: break
+      chunks.append(chunk)
+    sock.close()
+  except (socket.error, OSError) as err:
+    sock.close()
+    return '!!! NO ANSWER FROM searchf_server: ' + str(err) + '\n' + \
+           '!!! TO SEARCH WITHOUT THE SERVER, SET THE ENVIRONMENT VARIABLE SEARCHF_NO_SERVER.\n'
+
+  reply = b''.join(chunks).decode('utf-8', 'replace')
+  if reply[0:3] != 'OK\n': return None
+  return reply[3:]
 
 #------------------------------------------------------------------------------------
 #------------------------------------------------------------------------------------
@@ -553,6 +1211,14 @@ def search_tree (search_base_dir, search_com):
 
 def search_all (doc_type):
 
+  # Use searchf_server if it is running.
+
+  if doc_type != 'LIST' and index_cache is None and 'SEARCHF_NO_SERVER' not in os.environ:
+    output = query_server(doc_type)
+    if output is not None:
+      sys.stdout.write(output)
+      return
+
   search_com = search_com_class()
   search_com.found_one = False
   search_com.doc_type = doc_type
@@ -589,9 +1255,18 @@ def search_all (doc_type):
       i += 1
       continue
 
+    if arg == '-f':
+      search_com.fuzzy = True
+      continue
+
     if arg == '-h':
       print_help_message ()
 
+    if arg == '-j':
+      search_com.num_jobs = int(sys.argv[i+1])
+      i += 1
+      continue
+
     if arg == '-r':
       root_dir = sys.argv[i+1]
       i += 1
@@ -632,16 +1307,44 @@ def search_all (doc_type):
     match_str_in = sys.argv[i]
     search_com.match_str = match_str_in.replace('*', '\w*') 
 
+  # Cross references
+
+  if search_com.doc_type == 'REFS':
+    if not refs_search(dir_list, search_com): print ('\nNo references found for: ' + match_str_in)
+    print ('')
+    return
+
+  # Fuzzy search
+
+  if search_com.fuzzy and search_com.doc_type != 'LIST':
+    print ('')
+    if fuzzy_search(dir_list, match_str_in) == 0:
+      print ('No names close to: ' + match_str_in)
+    print ('')
+    return
+
   # Search for a match.
+  # A pool is only needed if some search directory has no searchf.index file to answer the query.
+
+  pool = None
+  if search_com.num_jobs > 1 and index_cache is None:
+    if search_com.doc_type == 'LIST' or not all(has_index(dir) for dir in dir_list): pool = Pool(search_com.num_jobs)
 
   for dir in dir_list:
-    search_tree (dir, search_com)
+    search_tree (dir, search_com, pool)
+
+  if pool is not None:
+    pool.close()
+    pool.join()
 
   # And finish
 
   if search_com.doc_type != 'LIST':
     if not search_com.found_one:
       print ('Cannot match String: ' + match_str_in)
+      if re.match('\w+$', match_str_in):
+        print ('Did you mean:')
+        if fuzzy_search(dir_list, match_str_in, max_print = 10, indent = '      ') == 0: print ('      [No close names found]')
       print ('Use "-h" command line option to list options.')
     else:
       print ('')
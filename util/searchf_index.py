@@ -0,0 +1,323 @@
+#+
+# searchf_index.py holds the persistent symbol index used by getf and listf.
+#
+# The index is an SQLite file "searchf.index" placed in a root search directory next to
+# searchf.namelist. It is created by create_searchf_namelist. For each routine, struct,
+# parameter, and module the index holds the file, line number, and character offsets of the
+# documentation comment block and of the definition so getf only needs to read that part of the file.
+# C/C++ files are indexed the same way with their functions, classes and structs.
+#
+# Names are stored lower case (Fortran is case insensitive and C names are matched case
+# insensitively unless getf -c is used). Exact and prefix lookups use the B-tree index on the
+# name column. Wildcard lookups like "*_to_bmad" use an index on the reversed name.
+#
+# The modification time, size and SHA-1 hash of each file is stored so that create_searchf_namelist
+# only needs to parse files that have changed.
+#
+# The index also holds the cross references (calls, use statements, type declarations and type
+# component references) found in the Fortran files. These are used by the refs script.
+#-
+
+import os
+import sqlite3
+import hashlib
+import bisect
+
+index_version = '5'
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# A symbol found in a source file.
+# Offsets are character offsets (= byte offsets since files are read as ISO-8859-1).
+# [doc_start, doc_end) is the comment block before the definition. doc_start = doc_end if no comments.
+# [def_start, def_end) is the definition: The first line of a module, the first line plus continuation
+# lines of a routine or parameter, and the entire type or interface block of a struct.
+# For C/C++ see searchf.parse_c.
+
+class symbol_class:
+  def __init__(self, name, kind, line_num, doc_start, doc_end, def_start, def_end):
+    self.name      = name        # Lower case.
+    self.kind      = kind        # 'routine', 'struct', 'parameter', or 'module'
+    self.line_num  = line_num    # Line number (1 = first line) of the definition.
+    self.doc_start = doc_start
+    self.doc_end   = doc_end
+    self.def_start = def_start
+    self.def_end   = def_end
+    self.file_ix   = 0           # Index of the file in the index files table.
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# Return the largest string prefix of a regular expression that any match must start with.
+
+def literal_prefix (regex):
+  if '|' in regex: return ''   # Alternatives may start differently.
+  prefix = ''
+  for char in regex:
+    if char in '.^$*+?{}[]\\|()':
+      if char in '*?{' and prefix != '': prefix = prefix[:-1]   # Last char is optional or repeated.
+      break
+    prefix += char
+  return prefix
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# Return the largest string suffix of a regular expression that any match must end with.
+
+def literal_suffix (regex):
+  if '|' in regex: return ''
+  suffix = ''
+  for char in reversed(regex):
+    if char in '.^$*+?{}[]\\|()':
+      if char == '\\' and suffix != '': suffix = suffix[1:]   # First char is part of an escape sequence.
+      break
+    suffix = char + suffix
+  return suffix
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# Return the name with a trailing "$" (as used for parameters) removed and reversed.
+
+def reversed_name (name):
+  if name[-1:] == '$': name = name[:-1]
+  return name[::-1]
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# Return list of [distance, name] for the names within an edit (Levenshtein) distance of max_dist of word.
+# names must be a sorted list. The list is ordered by distance and then name.
+#
+# The sorted list is traversed as a trie would be: The distance table rows for the common prefix
+# of a name and the previous name are reused and if all entries in a row exceed max_dist, all
+# names starting with that prefix are skipped using a binary search.
+
+def fuzzy_match (word, names, max_dist = 2):
+  n_word = len(word)
+  rows = [list(range(n_word+1))]   # rows[k] is the distance table row for the first k characters of a name.
+  prev = ''
+  matches = []
+
+  ix = 0
+  while ix < len(names):
+    name = names[ix]
+    n_common = 0
+    while n_common < len(prev) and n_common < len(name) and prev[n_common] == name[n_common]: n_common += 1
+    del rows[n_common+1:]
+
+    pruned = False
+    for k in range(n_common+1, len(name)+1):
+      char = name[k-1]
+      above = rows[k-1]
+      row = [k]
+      for j in range(1, n_word+1):
+        row.append(min(above[j] + 1, row[j-1] + 1, above[j-1] + (word[j-1] != char)))
+      rows.append(row)
+      if min(row) > max_dist:
+        prev = name[:k]
+        ix = bisect.bisect_left(names, prev + '\x7f', ix)   # Skip all names with this prefix.
+        pruned = True
+        break
+
+    if pruned: continue
+    if rows[-1][-1] <= max_dist: matches.append([rows[-1][-1], name])
+    prev = name
+    ix += 1
+
+  matches.sort()
+  return matches
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# Index class
+
+class symbol_index_class:
+
+  def __init__(self, index_file):
+    self.index_file = index_file
+    self.db = sqlite3.connect(index_file)
+
+  def close (self):
+    self.db.close()
+
+  #----------------------------------
+  # Create empty tables.
+
+  def create (self):
+    db = self.db
+    db.execute('DROP TABLE IF EXISTS meta')
+    db.execute('DROP TABLE IF EXISTS files')
+    db.execute('DROP TABLE IF EXISTS symbols')
+    db.execute('DROP TABLE IF EXISTS refs')
+    db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+    db.execute('CREATE TABLE files (ix INTEGER PRIMARY KEY, path TEXT UNIQUE, lang TEXT, mtime REAL, size INTEGER, hash TEXT)')
+    db.execute('CREATE TABLE symbols (name TEXT, kind TEXT, file_ix INTEGER, line INTEGER, ' +
+                          'doc_start INTEGER, doc_end INTEGER, def_start INTEGER, def_end INTEGER, rname TEXT)')
+    db.execute('CREATE TABLE refs (name TEXT, kind TEXT, file_ix INTEGER, line INTEGER, caller TEXT)')
+    db.execute('INSERT INTO meta VALUES (?, ?)', ('version', index_version))
+
+  def create_name_index (self):
+    self.db.execute('CREATE INDEX IF NOT EXISTS symbol_name ON symbols (name)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS symbol_rname ON symbols (rname)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS ref_name ON refs (name)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS ref_caller ON refs (caller)')
+    self.db.commit()
+
+  #----------------------------------
+  # Add a file and its symbols and cross references. path is relative to the root search directory.
+  # lang is 'f90' or 'c'.
+  # Each ref is a list [name, kind, line_num, caller]. See searchf.find_refs.
+
+  def add_file (self, path, lang, mtime, size, hash, symbols, refs = []):
+    cur = self.db.execute('INSERT INTO files (path, lang, mtime, size, hash) VALUES (?, ?, ?, ?, ?)', (path, lang, mtime, size, hash))
+    file_ix = cur.lastrowid
+    self.db.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+          [(sym.name, sym.kind, file_ix, sym.line_num, sym.doc_start, sym.doc_end, sym.def_start, sym.def_end,
+                                                                        reversed_name(sym.name)) for sym in symbols])
+    self.db.executemany('INSERT INTO refs VALUES (?, ?, ?, ?, ?)', [(ref[0], ref[1], file_ix, ref[2], ref[3]) for ref in refs])
+    return file_ix
+
+  #----------------------------------
+  # Return list of symbols of a file in the order they were added.
+
+  def file_symbols (self, file_ix):
+    syms = []
+    for row in self.db.execute('SELECT * FROM symbols WHERE file_ix = ? ORDER BY rowid', (file_ix,)):
+      sym = symbol_class(row[0], row[1], row[3], row[4], row[5], row[6], row[7])
+      sym.file_ix = file_ix
+      syms.append(sym)
+    return syms
+
+  #----------------------------------
+  # Return list of cross references of a file in the order they were added.
+
+  def file_refs (self, file_ix):
+    return [list(row) for row in self.db.execute('SELECT name, kind, line, caller FROM refs WHERE file_ix = ? ORDER BY rowid', (file_ix,))]
+
+  #----------------------------------
+  # Return dict of path -> [file_ix, lang, mtime, size, hash]
+
+  def file_info (self):
+    rows = self.db.execute('SELECT path, ix, lang, mtime, size, hash FROM files')
+    return dict((row[0], list(row[1:])) for row in rows)
+
+  #----------------------------------
+  # Return SQL condition, and arguments, to narrow a search on a name column using the literal prefix of a regex.
+
+  def name_condition (self, column, regex):
+    prefix = literal_prefix(regex)
+    if prefix == regex: return column + ' = ?', [regex]
+    if prefix != '': return column + ' >= ? AND ' + column + ' < ?', [prefix, prefix + '\x7f']
+    return '1', []
+
+  #----------------------------------
+  # Return list of [name, kind, path, line, caller] for the cross references to (if to_name is True) or 
+  # from (if to_name is False) names that match the regex. 
+  # 'fref' references (which may be array references) are only included if the name is a routine.
+  # The list is ordered by file and line.
+
+  def cross_refs (self, regex, re_match, to_name = True):
+    if to_name:
+      column = 'refs.name'
+    else:
+      column = 'refs.caller'
+    cond, args = self.name_condition(column, regex)
+    rows = self.db.execute('SELECT refs.name, refs.kind, files.path, refs.line, refs.caller FROM refs ' +
+                   'JOIN files ON refs.file_ix = files.ix WHERE ' + cond + ' AND (refs.kind != ? OR refs.name IN ' +
+                   '(SELECT name FROM symbols WHERE kind = ?)) ORDER BY refs.file_ix, refs.line', args + ['fref', 'routine'])
+    if to_name:
+      return [list(row) for row in rows if re_match.match(row[0])]
+    else:
+      return [list(row) for row in rows if re_match.match(row[4])]
+
+  #----------------------------------
+  # Return dict of name -> list of [kind, path] for all symbols. A trailing "$" is removed from parameter names.
+
+  def name_files (self):
+    name_dict = {}
+    for name, kind, path in self.db.execute('SELECT symbols.name, symbols.kind, files.path FROM symbols ' +
+                                                   'JOIN files ON symbols.file_ix = files.ix'):
+      if name[-1:] == '$': name = name[:-1]
+      name_dict.setdefault(name, []).append([kind, path])
+    return name_dict
+
+  #----------------------------------
+
+  def is_valid (self):
+    try:
+      row = self.db.execute('SELECT value FROM meta WHERE key = ?', ('version',)).fetchone()
+    except sqlite3.DatabaseError:
+      return False
+    return row is not None and row[0] == index_version
+
+  #----------------------------------
+  # Return dict of file_ix -> [path, lang, mtime, size]
+
+  def files (self, lang = None):
+    if lang is None:
+      rows = self.db.execute('SELECT ix, path, lang, mtime, size FROM files ORDER BY ix')
+    else:
+      rows = self.db.execute('SELECT ix, path, lang, mtime, size FROM files WHERE lang = ? ORDER BY ix', (lang,))
+    return dict((row[0], list(row[1:])) for row in rows)
+
+  #----------------------------------
+  # Return list of symbols whose name matches re_match (a compiled regex that must match the whole name).
+  # The name search is narrowed using the literal prefix of the regex: An exact lookup if the regex
+  # is a plain name and a range scan if the regex starts with a plain prefix. Otherwise, if the regex
+  # ends with a plain suffix, a range scan on the reversed name is done.
+  # Parameter names have a trailing "$" and C names may have a trailing "_" (as used for routines called
+  # from Fortran) so re_match should allow for an optional "_".
+  # Symbols are ordered by file and position in file.
+
+  def lookup (self, regex, re_match):
+    prefix = literal_prefix(regex)
+    if prefix == regex:
+      rows = self.db.execute('SELECT * FROM symbols WHERE name = ? OR name = ? OR name = ?', (regex, regex + '$', regex + '_'))
+    elif prefix != '':
+      rows = self.db.execute('SELECT * FROM symbols WHERE name >= ? AND name < ?', (prefix, prefix + '\x7f'))
+    elif literal_suffix(regex) != '':
+      rprefix = literal_suffix(regex)[::-1]
+      rows = self.db.execute('SELECT * FROM symbols WHERE (rname >= ? AND rname < ?) OR (rname >= ? AND rname < ?)',
+                                         (rprefix, rprefix + '\x7f', '_' + rprefix, '_' + rprefix + '\x7f'))
+    else:
+      rows = self.db.execute('SELECT * FROM symbols')
+
+    syms = []
+    for row in rows:
+      name = row[0]
+      if not re_match.match(name) and not (row[1] == 'parameter' and name[-1] == '$' and re_match.match(name[:-1])): continue
+      sym = symbol_class(name, row[1], row[3], row[4], row[5], row[6], row[7])
+      sym.file_ix = row[2]
+      syms.append(sym)
+
+    syms.sort(key = lambda sym: (sym.file_ix, sym.def_start))
+    return syms
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# SHA-1 hash of the contents of a file.
+
+def file_hash (file_name):
+  with open(file_name, 'rb') as f:
+    return hashlib.sha1(f.read()).hexdigest()
+
+#------------------------------------------------------------------------------------
+#------------------------------------------------------------------------------------
+# Open an index file. Return None if the file does not exist or is not a valid index.
+# If in_memory is True, the index is copied into memory and the file is closed.
+
+def open_index (index_file, in_memory = False):
+  if not os.path.isfile(index_file): return None
+  try:
+    index = symbol_index_class(index_file)
+  except sqlite3.Error:
+    return None
+  if not index.is_valid():
+    index.close()
+    return None
+
+  if in_memory:
+    db = sqlite3.connect(':memory:')
+    index.db.backup(db)
+    index.db.close()
+    index.db = db
+
+  return index
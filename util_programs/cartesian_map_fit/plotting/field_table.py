@@ -0,0 +1,38 @@
+# Routines for reading cartesian_map_fit field tables (see the "Field Table File" section of the DOC file).
+
+import os
+import numpy as np
+
+#------------------------------------------------------------------
+# Read the seven line header of a field table.
+# Returns the index bounds n_min(3), n_max(3) and the grid spacing del_r(3) in the units of the table.
+
+def read_header(file_name):
+  dat_file = open(file_name, 'r')
+  vals = []
+  for i in range(7):
+    vals.append(dat_file.readline().replace(',', ' ').split('!')[0].split())
+  dat_file.close()
+
+  n_min = np.array([int(vals[2][0]), int(vals[3][0]), int(vals[4][0])])
+  n_max = np.array([int(vals[2][1]), int(vals[3][1]), int(vals[4][1])])
+  del_r = np.array([float(v) for v in vals[5][0:3]])
+  return n_min, n_max, del_r
+
+#------------------------------------------------------------------
+# Load a field table as a (nx, ny, nz, 3) array of (Bx, By, Bz) indexed by grid point.
+# The array is cached in a <file_name>.npy file which is memory mapped on subsequent calls.
+# The cache is rebuilt if the table is newer than the cache.
+
+def load_field_grid(file_name):
+  n_min, n_max, del_r = read_header(file_name)
+  cache_name = file_name + '.npy'
+
+  if not os.path.exists(cache_name) or os.path.getmtime(cache_name) < os.path.getmtime(file_name):
+    table = np.loadtxt(file_name, skiprows = 7, comments = '!', ndmin = 2)
+    index = np.rint(table[:,0:3] / del_r).astype(int) - n_min
+    grid = np.zeros(tuple(n_max - n_min + 1) + (3,))
+    grid[index[:,0], index[:,1], index[:,2]] = table[:,3:6]
+    np.save(cache_name, grid)
+
+  return n_min, del_r, np.load(cache_name, mmap_mode = 'r')
@@ -0,0 +1,134 @@
+#+
+# fit_residuals.py
+#
+# Full volume comparison of a cartesian_map_fit fit table to the field table it was fit to.
+# Both tables are loaded as memory mapped (nx, ny, nz, 3) grids (see field_table.py) and the
+# residual statistics are accumulated over slabs of constant x so memory use stays bounded.
+#
+# Syntax:
+#   python fit_residuals.py [-o <report_file>] [-n <n_radius_bins>] <field_table> <fit_table>
+#
+# All values in the report are in the length and field units of the tables.
+#-
+
+import sys, argparse
+import numpy as np
+from field_table import load_field_grid
+
+comp_name = ['Bx', 'By', 'Bz']
+
+#------------------------------------------------------------------
+# Accumulate residual sums over the grid.
+
+def residual_stats(dat_grid, fit_grid, n_min, del_r, n_radius):
+  nx, ny, nz = dat_grid.shape[0:3]
+  y = (np.arange(ny) + n_min[1]) * del_r[1]
+  r_max = np.hypot(max(abs(n_min[0]), abs(n_min[0] + nx - 1)) * del_r[0], np.abs(y).max())
+  r_bin_width = max(r_max, 1e-30) / n_radius
+
+  st = {}
+  st['n_pts']   = nx * ny * nz
+  st['sum_abs'] = np.zeros(3)       # Sum |fit - dat|
+  st['sum_sq']  = np.zeros(3)       # Sum (fit - dat)^2
+  st['sum_dat'] = np.zeros(3)       # Sum |dat|
+  st['max_err'] = np.zeros(3)       # Max |fit - dat|
+  st['max_loc'] = np.zeros((3, 3))  # (x, y, z) of max error
+  st['z_sq']    = np.zeros((nz, 3))
+  st['z_max']   = np.zeros((nz, 3))
+  st['r_sq']    = np.zeros((n_radius, 3))
+  st['r_n']     = np.zeros(n_radius)
+  st['r_max']   = np.zeros((n_radius, 3))
+  st['r_bin_width'] = r_bin_width
+
+  for ix in range(nx):
+    dat = np.asarray(dat_grid[ix])    # (ny, nz, 3) slab
+    err = np.asarray(fit_grid[ix]) - dat
+    abs_err = np.abs(err)
+    sq = err**2
+
+    st['sum_abs'] += abs_err.sum(axis = (0, 1))
+    st['sum_sq']  += sq.sum(axis = (0, 1))
+    st['sum_dat'] += np.abs(dat).sum(axis = (0, 1))
+    st['z_sq']    += sq.sum(axis = 0)
+    st['z_max']   = np.maximum(st['z_max'], abs_err.max(axis = 0))
+
+    slab_max = abs_err.reshape(-1, 3).max(axis = 0)
+    for j in range(3):
+      if slab_max[j] <= st['max_err'][j]: continue
+      st['max_err'][j] = slab_max[j]
+      iy, iz = np.unravel_index(abs_err[:,:,j].argmax(), (ny, nz))
+      st['max_loc'][j] = (np.array([ix, iy, iz]) + n_min) * del_r
+
+    x = (ix + n_min[0]) * del_r[0]
+    ir = np.minimum((np.hypot(x, y) / r_bin_width).astype(int), n_radius - 1)   # Bin of each y
+    for j in range(3):
+      st['r_sq'][:,j]  += np.bincount(ir, weights = sq[:,:,j].sum(axis = 1), minlength = n_radius)
+      np.maximum.at(st['r_max'][:,j], ir, abs_err[:,:,j].max(axis = 1))
+    st['r_n'] += np.bincount(ir, minlength = n_radius) * nz
+
+  return st
+
+#------------------------------------------------------------------
+
+def write_report(f_out, st, dat_file_name, fit_file_name, n_min, del_r, nz):
+  n = st['n_pts']
+  b_diff = st['sum_abs'] / n
+  b_rms = np.sqrt(st['sum_sq'] / n)
+  b_dat = st['sum_dat'] / n
+
+  f_out.write('Field table: ' + dat_file_name + '\n')
+  f_out.write('Fit table:   ' + fit_file_name + '\n')
+  f_out.write('Number of grid points: ' + str(n) + '\n\n')
+
+  f_out.write('                   Bx              By              Bz             tot\n')
+  f_out.write('B_diff:   ' + ''.join('%16.6e' % v for v in np.append(b_diff, b_diff.sum())) + '\n')
+  f_out.write('B_rms:    ' + ''.join('%16.6e' % v for v in np.append(b_rms, np.sqrt((b_rms**2).sum()))) + '\n')
+  f_out.write('B_dat:    ' + ''.join('%16.6e' % v for v in np.append(b_dat, b_dat.sum())) + '\n')
+  f_out.write('B_max:    ' + ''.join('%16.6e' % v for v in st['max_err']) + '\n')
+  f_out.write('B_Merit:  ' + '%16.6e' % (b_diff.sum() / max(b_dat.sum(), 1e-300)) + '\n\n')
+
+  for j in range(3):
+    f_out.write('Max |d%s| at (x, y, z) = (%g, %g, %g)\n' % (comp_name[j], *st['max_loc'][j]))
+
+  f_out.write('\nError per z slice:\n')
+  f_out.write('        z       rms_Bx      rms_By      rms_Bz      max_Bx      max_By      max_Bz\n')
+  z_rms = np.sqrt(st['z_sq'] / (n / nz))
+  for iz in range(nz):
+    z = (iz + n_min[2]) * del_r[2]
+    f_out.write('%12.5g' % z + ''.join('%12.4e' % v for v in z_rms[iz]) + ''.join('%12.4e' % v for v in st['z_max'][iz]) + '\n')
+
+  f_out.write('\nError per radius bin (r = sqrt(x^2 + y^2)):\n')
+  f_out.write('    r_lo        r_hi    n_pts      rms_Bx      rms_By      rms_Bz      max_Bx      max_By      max_Bz\n')
+  w = st['r_bin_width']
+  for ir in range(len(st['r_n'])):
+    if st['r_n'][ir] == 0: continue
+    r_rms = np.sqrt(st['r_sq'][ir] / st['r_n'][ir])
+    f_out.write('%10.4g  %10.4g %8d' % (ir * w, (ir + 1) * w, st['r_n'][ir]) +
+                ''.join('%12.4e' % v for v in r_rms) + ''.join('%12.4e' % v for v in st['r_max'][ir]) + '\n')
+
+#------------------------------------------------------------------
+# Main program.
+
+argp = argparse.ArgumentParser()
+argp.add_argument('field_table', help = 'Field table that was fit.')
+argp.add_argument('fit_table', help = 'Fit table written by "cartesian_map_fit fit_table".')
+argp.add_argument('-o', '--output', help = 'Report file. Default: fit_residuals.txt', default = 'fit_residuals.txt')
+argp.add_argument('-n', '--n_radius', help = 'Number of radius bins. Default: 10', type = int, default = 10)
+arg = argp.parse_args()
+
+n_min, del_r, dat_grid = load_field_grid(arg.field_table)
+n_min_fit, del_r_fit, fit_grid = load_field_grid(arg.fit_table)
+
+if dat_grid.shape != fit_grid.shape or any(n_min != n_min_fit) or not np.allclose(del_r, del_r_fit):
+  print('FIELD AND FIT TABLE GRIDS DO NOT MATCH!')
+  sys.exit()
+
+st = residual_stats(dat_grid, fit_grid, n_min, del_r, arg.n_radius)
+
+f_out = open(arg.output, 'w')
+write_report(f_out, st, arg.field_table, arg.fit_table, n_min, del_r, dat_grid.shape[2])
+f_out.close()
+
+print('B_rms [Bx, By, Bz]: ' + str(np.sqrt(st['sum_sq'] / st['n_pts'])))
+print('B_max [Bx, By, Bz]: ' + str(st['max_err']))
+print('Wrote: ' + arg.output)
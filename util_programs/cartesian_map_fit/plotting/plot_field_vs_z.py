@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.widgets import Slider
 import time
+from field_table import load_field_grid
 # Input parameters
 
 dat_file_name = 'bmad_field.table'
@@ -9,79 +11,49 @@ x_val = 0.1    # Must correspond to a grid x-position value
 y_val = 0.2    # Must correspond to a grid y-position value
 plot_type = 'Bz'
 
-# Read header
-
-dat_file = open(dat_file_name, 'r')
-
-vals = dat_file.readline().replace(',', ' ').split('!')[0].split()
-pos_scale = float(vals[0])
-
-vals = dat_file.readline().replace(',', ' ').split('!')[0].split()
-field_scale = float(vals[0])
-
-vals = dat_file.readline().replace(',', ' ').split('!')[0].split()
-nx_min = float(vals[0])
-nx_max = float(vals[1])
-
-vals = dat_file.readline().replace(',', ' ').split('!')[0].split()
-ny_min = float(vals[0])
-ny_max = float(vals[1])
-
-vals = dat_file.readline().replace(',', ' ').split('!')[0].split()
-nz_min = float(vals[0])
-nz_max = float(vals[1])
-
-vals = dat_file.readline().replace(',', ' ').split('!')[0].split()
-del_x = float(vals[0])
-del_y = float(vals[1])
-del_z = float(vals[2])
-
-vals = dat_file.readline().replace(',', ' ').split('!')[0].split()
-x_off = float(vals[0])
-y_off = float(vals[1])
-z_off = float(vals[2])
+#------------------------------------------------------------------
+# Read data and fit tables
 
-dat_file.close()
+b_col = {'Bx': 0, 'By': 1}.get(plot_type, 2)
 
-# Read data and fit tables
+n_min, del_r, dat_grid = load_field_grid(dat_file_name)
+n_min_fit, del_r_fit, fit_grid = load_field_grid(fit_file_name)
 
-if plot_type == 'Bx':
-  b_row = 3
-elif plot_type == 'By':
-  b_row = 4
-else:
-  b_row = 5
+z_dat = (np.arange(dat_grid.shape[2]) + n_min[2]) * del_r[2]
+z_fit = (np.arange(fit_grid.shape[2]) + n_min_fit[2]) * del_r_fit[2]
 
-x_dat = []
-y_dat = []
+ix0 = int(round(x_val / del_r[0])) - n_min[0]
+iy0 = int(round(y_val / del_r[1])) - n_min[1]
 
-dat_table = np.loadtxt(dat_file_name, skiprows = 7)
-for row in dat_table:
-  if abs(row[0] - x_val) > 1e-5*del_x: continue
-  if abs(row[1] - y_val) > 1e-5*del_y: continue
-  x_dat.append(row[2])
-  y_dat.append(row[b_row])
+# Plot. The sliders select the (x, y) line to plot. Each line is a single array index.
 
+fig, ax = plt.subplots()
+plt.subplots_adjust(bottom = 0.25)
 
-x_fit = []
-y_fit = []
+line_dat, = ax.plot(z_dat, dat_grid[ix0, iy0, :, b_col], 'ro', markersize = 1, label = dat_file_name)
+line_fit, = ax.plot(z_fit, fit_grid[ix0, iy0, :, b_col], 'go', markersize = 1, label = fit_file_name)
 
-fit_table = np.loadtxt(fit_file_name, skiprows = 7)
-for row in fit_table:
-  if abs(row[0] - x_val) > 1e-5*del_x: continue
-  if abs(row[1] - y_val) > 1e-5*del_y: continue
-  x_fit.append(row[2])
-  y_fit.append(row[b_row])
+ax.set_xlabel('Z')
+ax.set_ylabel(plot_type)
+ax.legend()
 
-# Plot
+x_slider = Slider(plt.axes([0.15, 0.10, 0.7, 0.03]), 'x', n_min[0] * del_r[0], (n_min[0] + dat_grid.shape[0] - 1) * del_r[0],
+                  valinit = (ix0 + n_min[0]) * del_r[0], valstep = del_r[0])
+y_slider = Slider(plt.axes([0.15, 0.05, 0.7, 0.03]), 'y', n_min[1] * del_r[1], (n_min[1] + dat_grid.shape[1] - 1) * del_r[1],
+                  valinit = (iy0 + n_min[1]) * del_r[1], valstep = del_r[1])
 
-plt.plot(x_dat, y_dat, 'ro', markersize = 1, label = dat_file_name)
-plt.plot(x_fit, y_fit, 'go', markersize = 1, label = fit_file_name)
-plt.plot([], [], ' ', label = 'x = ' + str(x_val))  # For creating the legend
-plt.plot([], [], ' ', label = 'y = ' + str(y_val))
+def update(val):
+  ix = int(round(x_slider.val / del_r[0])) - n_min[0]
+  iy = int(round(y_slider.val / del_r[1])) - n_min[1]
+  line_dat.set_ydata(dat_grid[ix, iy, :, b_col])
+  ix = int(round(x_slider.val / del_r_fit[0])) - n_min_fit[0]
+  iy = int(round(y_slider.val / del_r_fit[1])) - n_min_fit[1]
+  line_fit.set_ydata(fit_grid[ix, iy, :, b_col])
+  ax.relim()
+  ax.autoscale_view()
+  fig.canvas.draw_idle()
 
-plt.xlabel('Z')
-plt.ylabel(plot_type)
-plt.legend()
+x_slider.on_changed(update)
+y_slider.on_changed(update)
 
 plt.show()
@@ -0,0 +1,79 @@
+#! /usr/bin/python
+####BENCHMARK BMAD LATTICE LOAD TIME####
+####ASCII VERSUS HDF5 GRID FIELD####
+
+# Converts an Opera table to both the ASCII and HDF5 grid_field formats, makes a small lattice
+# calling each, and times how long Tao takes to load the lattice and quit.
+# The element is a quadrupole with field_calc = fieldmap calling the grid_field file. What is timed is Tao
+# starting, reading the lattice (including the field map), doing its initial lattice calculation and quitting.
+# The calculation uses the default tracking method, which does not evaluate the field map, so the difference
+# between the two formats is the time to read the field map.
+
+import os, sys, argparse, subprocess, time
+import numpy as np
+import opera_fieldmap_to_bmad as opera
+
+#########################################################################
+
+def write_lattice(lat_file, grid_file, length):
+  f = open(lat_file, 'w')
+  f.write('parameter[geometry] = open\n')
+  f.write('parameter[particle] = proton\n')
+  f.write('parameter[p0c] = 1e9\n')
+  f.write('beginning[beta_a] = 10\n')
+  f.write('beginning[beta_b] = 10\n\n')
+  f.write('mag: quadrupole, l = ' + '%.10g' % length + ', field_calc = fieldmap, grid_field = call::' + grid_file + '\n\n')
+  f.write('lat: line = (mag)\n')
+  f.write('use, lat\n')
+  f.close()
+
+#########################################################################
+
+def time_load(tao_exe, lat_file, n_repeat):
+  times = []
+  for i in range(n_repeat):
+    t0 = time.time()
+    subprocess.run([tao_exe, '-noinit', '-noplot', '-quiet', '-lat', lat_file, '-command', 'quit'],
+                                      stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, check = True)
+    times.append(time.time() - t0)
+  return np.array(times)
+
+#########################################################################
+
+def main( argv ):
+  argp = argparse.ArgumentParser()
+  argp.add_argument('opera_file', help = 'Name of input Opera table file')
+  argp.add_argument('-n', '--repeat', help = 'Number of times each lattice is loaded. Default: 3', type = int, default = 3)
+  argp.add_argument('-t', '--tao', help = 'Tao executable. Default: $ACC_EXE/tao or tao', default = '')
+  arg = argp.parse_args(argv)
+
+  tao_exe = arg.tao
+  if tao_exe == '': tao_exe = os.path.join(os.environ['ACC_EXE'], 'tao') if 'ACC_EXE' in os.environ else 'tao'
+
+  units = 1e-4
+  base = 'bmad_parse_' + os.path.basename(arg.opera_file)
+  r0, dr, index, field = opera.read_opera_table(arg.opera_file)
+  length = dr[2] * index[:,2].max()
+
+  t0 = time.time()
+  opera.write_ascii_grid_field(base, r0, dr, index, field, units)
+  t_ascii = time.time() - t0
+  t0 = time.time()
+  opera.write_hdf5_grid_field(base + '.h5', r0, dr, index, field, units)
+  t_hdf5 = time.time() - t0
+
+  write_lattice('bench_ascii.bmad', base, length)
+  write_lattice('bench_hdf5.bmad', base + '.h5', length)
+
+  print('Number of nodes: ' + str(len(field)))
+  print('Format   File size (MB)   Write time (sec)   Load time (sec): mean  min')
+  for name, grid_file, lat_file, t_write in [('ASCII', base, 'bench_ascii.bmad', t_ascii),
+                                             ('HDF5', base + '.h5', 'bench_hdf5.bmad', t_hdf5)]:
+    t_load = time_load(tao_exe, lat_file, arg.repeat)
+    size = os.path.getsize(grid_file) / 1e6
+    print('%-8s %14.2f %18.2f %20.3f %6.3f' % (name, size, t_write, t_load.mean(), t_load.min()))
+
+#########################################################################
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -5,135 +5,396 @@
 # Parse opera field map table to bmad field map format.
 # Developed by: Henry Lovelace III
 
-import os, sys, stat, math
-import glob
+import os, sys, re, argparse, time
 import numpy as np
-import time
-import matplotlib.pyplot as plt
+from multiprocessing import Pool
 #########################################################################
 
-def main( argv ):
-  opera_file = sys.argv[1]
+#Length scale of a coordinate column given its header line. EG: " 1 X [CM]"
+def length_scale(col_line):
+  unit = col_line.upper()
+  if 'MM' in unit: return .001
+  if 'CM' in unit: return .01
+  if 'LENGU' in unit: return .01
+  return 1.0
+
+#########################################################################
+#Read the opera table header. Leaves o_f positioned at the start of the numeric block.
+#Returns the number of nodes and the header lines (node count line followed by the column definition lines).
+
+def read_opera_header(o_f):
+  tot_nodes = o_f.readline().split()
+  all_nodes = int(tot_nodes[0])*int(tot_nodes[1])*int(tot_nodes[2])
+
+#Column definition lines (EG: " 1 X [CM]") end with a line containing only "0"
+  col_lines = []
+  while True:
+    here = o_f.tell()
+    line = o_f.readline()
+    if line == '' or line.split() == ['0']: break
+    if not re.match(r'\s*\d+\s+[A-Za-z]', line):
+      o_f.seek(here)
+      break
+    col_lines.append(' '.join(line.split()))
+
+  return all_nodes, [' '.join(tot_nodes)] + col_lines
+
+#########################################################################
+#Integer grid index of each node position given the grid origin and spacing.
+
+def grid_index(pos, r0, dr):
+  index = np.zeros(pos.shape, dtype = np.int32)
+  for j in range(3):
+    if dr[j] != 0: index[:,j] = np.rint((pos[:,j] - r0[j]) / dr[j])
+  return index
+
+#########################################################################
+#Read the opera table.
+#Returns the grid origin r0 and spacing dr (meters), the integer grid index (ix, iy, iz) of each node
+#and the node fields (Bx, By, Bz) in units of the table. Nodes are kept in the order of the table.
+#If shared_grid = (header, r0, dr, index), as returned by detect_grid, matches the table (same header and
+#same grid index for every node), the grid is reused instead of being derived again.
+
+def read_opera_table(opera_file, shared_grid = None):
   o_f = open(opera_file,'r')
-  bmad_parse = os.path.join(os.getcwd(),'bmad_parse_'+opera_file)
-  b_p=open(bmad_parse,'w')
+  all_nodes, header = read_opera_header(o_f)
+  scale = np.array([length_scale(header[1]), length_scale(header[2]), length_scale(header[3])])
+
+  table = np.loadtxt(o_f, usecols = (0, 1, 2, 3, 4, 5), max_rows = all_nodes, ndmin = 2)
+  o_f.close()
+
+  pos = table[:,0:3]
+  field = table[:,3:6]
+
+  if shared_grid is not None:
+    h, r0, dr, index = shared_grid
+    if h == header and np.array_equal(grid_index(pos, r0 / scale, dr / scale), index): return r0, dr, index, field
+    print('Note: ' + opera_file + ' does not match the shared grid. Its grid will be derived separately.')
+
+#Grid spacing from the distinct coordinate values. Averaging over the full span avoids round off in single steps.
+  r0 = pos.min(axis = 0)
+  dr = np.zeros(3)
+  for j in range(3):
+    u = np.unique(pos[:,j])
+    if len(u) > 1: dr[j] = (u[-1] - u[0]) / (len(u) - 1)
+
+  index = grid_index(pos, r0, dr)
+
+  r0 = r0 * scale
+  dr = dr * scale
+  return r0, dr, index, field
 
 #########################################################################
-#Gauss (1e-4)or Tesla (1)
-  units = 1e-4
+#Read an opera table and derive its grid for use as the shared_grid argument of read_opera_table.
+#Returns the shared grid and the (r0, dr, index, field) of the table so the table does not have to be read again.
+
+def detect_grid(opera_file):
+  o_f = open(opera_file,'r')
+  all_nodes, header = read_opera_header(o_f)
+  o_f.close()
+
+  r0, dr, index, field = read_opera_table(opera_file)
+  return (header, r0, dr, index), (r0, dr, index, field)
+
+#########################################################################
+#Convert between node lists (index, field) and a dense grid array grid[ix, iy, iz, :].
+
+def nodes_to_grid(index, field):
+  grid = np.zeros(tuple(index.max(axis = 0) + 1) + (3,))
+  grid[index[:,0], index[:,1], index[:,2]] = field
+  return grid
+
+def grid_to_nodes(grid):
+  index = np.indices(grid.shape[0:3], dtype = np.int32).reshape(3, -1).T
+  return index, grid.reshape(-1, 3)
+
+#########################################################################
+#Crop the grid to the nodes inside the box r_min <= (x, y, z) <= r_max (meters).
+
+def crop_grid(grid, r0, dr, r_min, r_max):
+  lo = np.zeros(3, dtype = int)
+  hi = np.array(grid.shape[0:3]) - 1
+  for j in range(3):
+    if dr[j] == 0: continue
+    lo[j] = max(lo[j], int(np.ceil((r_min[j] - r0[j]) / dr[j] - 1e-6)))
+    hi[j] = min(hi[j], int(np.floor((r_max[j] - r0[j]) / dr[j] + 1e-6)))
+  if any(hi < lo): sys.exit('ERROR: CROP BOX DOES NOT CONTAIN ANY GRID NODES.')
+
+  grid = grid[lo[0]:hi[0]+1, lo[1]:hi[1]+1, lo[2]:hi[2]+1]
+  return grid, r0 + lo * dr
+
+#########################################################################
+#Keep every step(j)-th node along each axis.
+
+def decimate_grid(grid, dr, step):
+  step = np.array(step)
+  return grid[::step[0], ::step[1], ::step[2]], dr * step
+
+#########################################################################
+#Resample the grid onto a grid of spacing dr_new (meters) with the same origin using trilinear interpolation.
+#Trilinear interpolation on a regular grid is done as linear interpolation along each axis in turn.
+
+def resample_grid(grid, dr, dr_new):
+  dr_out = np.array(dr, dtype = float)
+  for j in range(3):
+    n = grid.shape[j]
+    if dr[j] == 0 or dr_new[j] <= 0 or n == 1: continue
+    n_new = int(np.floor((n - 1) * dr[j] / dr_new[j] + 1e-6)) + 1
+    t = np.arange(n_new) * (dr_new[j] / dr[j])
+    i0 = np.minimum(np.floor(t).astype(int), n - 2)
+    w = (t - i0).reshape((-1,) + (1,) * (3 - j))
+    grid = (1 - w) * np.take(grid, i0, axis = j) + w * np.take(grid, i0 + 1, axis = j)
+    dr_out[j] = dr_new[j]
+  return grid, dr_out
+
+#########################################################################
+#Fold a rotationally symmetric field onto the y = 0, x >= 0 half plane.
+#On this half plane (Bx, By, Bz) = (B_r, B_phi, B_z). Returned grid is grid[ir, 0, iz, :].
+
+def fold_rz(grid, r0, dr):
+  i_axis = np.zeros(2, dtype = int)
+  for j in range(2):
+    i_axis[j] = 0 if dr[j] == 0 else int(np.rint(-r0[j] / dr[j]))
+    if i_axis[j] < 0 or i_axis[j] >= grid.shape[j] or abs(r0[j] + i_axis[j] * dr[j]) > 1e-6 * max(dr[j], 1):
+      sys.exit('ERROR: GRID DOES NOT HAVE NODES ON THE X = 0 AND Y = 0 PLANES NEEDED FOR RZ SYMMETRY.')
+
+  grid = grid[i_axis[0]:, i_axis[1]:i_axis[1]+1, :, :]
+  return grid, np.array([0.0, 0.0, r0[2]]), np.array([dr[0], 0.0, dr[2]])
+
+#########################################################################
+#Write the "pt(ix, iy, iz) = (Bx, By, Bz)" lines. The index array may have 2 (rz geometry) or 3 columns.
+#Lines are formatted and written a chunk of nodes at a time so memory use is bounded by chunk_size.
+
+def write_grid_points(b_p, index, field, units, chunk_size = 100000):
+  ni = index.shape[1]
+  row_fmt = 'pt( ' + ', '.join(['%d'] * ni) + ') = (%.15g, %.15g, %.15g),\n'
+  n = len(field)
+  for i0 in range(0, n, chunk_size):
+    i1 = min(i0 + chunk_size, n)
+    block = np.empty((i1-i0, ni+3))
+    block[:,0:ni] = index[i0:i1]
+    block[:,ni:] = field[i0:i1] * units
+    text = (row_fmt * (i1-i0)) % tuple(block.ravel().tolist())
+    if i1 == n: text = text[:-2] + '}\n'   # Last point closes the grid
+    b_p.write(text)
+
+#########################################################################
+
+#Write the grid field in Bmad's ASCII format.
+#For geometry = rotationally_symmetric_rz the iy index column and dr[1] are not written.
+
+def write_ascii_grid_field(bmad_parse, r0, dr, index, field, units, geometry = 'xyz'):
+  b_p=open(bmad_parse,'w')
 
-#ITERATOR AND POINTS
-  i=8
-  x=0
-  y=0
-  z=0
-###Set increment for points###
-  increment = .01
-##############################
-  nodes=o_f.readlines()
-  tot_nodes=nodes[0].split()
-  all_nodes=int(tot_nodes[0])*int(tot_nodes[1])*int(tot_nodes[2])
-
-###Set increment for points for file###
-  if 'M' in nodes[1]:increment_x = 1.0
-  if 'CM' in nodes[1]:increment_x = .01
-  if 'LENGU' in nodes[1]:increment_x = .01
-  if 'MM' in nodes[1]:increment_x = .001
-  
-  if 'M' in nodes[2]:increment_y = 1.0
-  if 'CM' in nodes[2]:increment_y = .01
-  if 'LENGU' in nodes[2]:increment_y = .01
-  if 'MM' in nodes[2]:increment_y = .001
-
-  if 'M' in nodes[3]:increment_z = 1.0
-  if 'CM' in nodes[3]:increment_z = .01
-  if 'LENGU' in nodes[3]:increment_z = .01
-  if 'MM' in nodes[3]:increment_z = .001
- 
 # Hard coded limit to array in Python is 536,870,912 on 32 bit system
-  b_p.write('{ geometry = xyz, \n')
+  b_p.write('{ geometry = ' + geometry + ', \n')
   b_p.write('  field_type = magnetic, \n')
   b_p.write('  field_scale = 1.0, \n')
   b_p.write('  ele_anchor_pt = center, \n') # double check your field map, you may want to change this.
 
 #(x,y,z) = dr * (ix,iy,iz) + r0 + r_anchor
 
-  initial_value=nodes[8].split()
-  initial_x=float(initial_value[0])*increment_x#*1e-2         
-  initial_y=float(initial_value[1])*increment_y#*1e-2
-  initial_z=float(initial_value[2])*increment_z#*1e-2
-  b_p.write('r0=('+str(initial_x)+', '+str(initial_y)+', '+str(initial_z)+'),\n')
-#Stupid iteration I will find something smarter 
-  test_x = initial_x
-  test_y = initial_y
-  test_z = initial_z
-  
-  dr_x = 0
-  dr_y = 0
-  dr_z = 0
-
-  for x in range (int(tot_nodes[0])):
-   for y in range (int(tot_nodes[1])):
-    for z in range (int(tot_nodes[2])):       
-     find_dr=nodes[i].split()
-     if i==int(all_nodes+7):
-      break
-     else:
-      dr_x = np.abs(float(find_dr[0])-test_x)
-      if dr_x != 0:
-       dr_x_set = dr_x
-      test_x = float(find_dr[0])
-      i=i+1
-  i = 8
-
-  for x in range (int(tot_nodes[0])):
-   for y in range (int(tot_nodes[1])):
-    for z in range (int(tot_nodes[2])):       
-     find_dr=nodes[i].split()
-     if i==int(all_nodes+7):
-      break
-     else:
-      dr_y = np.abs(float(find_dr[1])-test_y)
-      if dr_y != 0:
-       dr_y_set = dr_y
-      test_y = float(find_dr[1])
-      i=i+1
-  i = 8
-
-  for x in range (int(tot_nodes[0])):
-   for y in range (int(tot_nodes[1])):
-    for z in range (int(tot_nodes[2])):       
-     find_dr=nodes[i].split()
-     if i==int(all_nodes+7):
-      break
-     else:
-      dr_z = np.abs(float(find_dr[2])-float(test_z))
-      if dr_z != 0:
-       dr_z_set = dr_z
-      test_z = float(find_dr[2])
-      i=i+1
-
-  i = 8
-  dr_x_set = dr_x_set*increment_x
-  dr_y_set = dr_y_set*increment_y
-  dr_z_set = dr_z_set*increment_z
-  b_p.write('dr=('+str(dr_x_set)+', '+str(dr_y_set)+', '+str(dr_z_set)+'), \n')
-#end of stupid iteration
+  b_p.write('r0=('+str(r0[0])+', '+str(r0[1])+', '+str(r0[2])+'),\n')
+  if geometry == 'xyz':
+    b_p.write('dr=('+str(dr[0])+', '+str(dr[1])+', '+str(dr[2])+'), \n')
+  else:
+    b_p.write('dr=('+str(dr[0])+', '+str(dr[2])+'), \n')
+    index = index[:,0::2]
 ################################################################################
-  for x in range (int(tot_nodes[0])):
-   for y in range (int(tot_nodes[1])):
-    for z in range (int(tot_nodes[2])):       
-     B_fields=nodes[i].split()
-     magnet_fields_Bx = float(B_fields[3])*units
-     magnet_fields_By = float(B_fields[4])*units
-     magnet_fields_Bz = float(B_fields[5])*units
-     
-     if i==int(all_nodes+7):
-      b_p.write('pt( '+str(x)+', '+str(y)+', '+str(z)+') = ('+str(magnet_fields_Bx)+', '+str(magnet_fields_By)+', '+str(magnet_fields_Bz)+')}\n')  
-      break         
-     else:
-      b_p.write('pt( '+str(x)+', '+str(y)+', '+str(z)+') = ('+str(magnet_fields_Bx)+', '+str(magnet_fields_By)+', '+str(magnet_fields_Bz)+'),\n')
-      i=i+1
+  write_grid_points(b_p, index, field, units)
+  b_p.close()
+
+#########################################################################
+#Write the grid field as a Bmad HDF5 (openPMD) grid_field file. See bmad/hdf5/hdf5_write_grid_field.f90.
+#Field components are stored as compressed, chunked datasets of complex (r, i) compound type.
+#A small ASCII info file with the geometry and the lattice call syntax is written alongside.
+
+def write_hdf5_grid_field(h5_file, r0, dr, index, field, units, geometry = 'xyz'):
+  import h5py
+
+  if geometry == 'xyz':
+    grid_geometry, axis_labels = 'rectangular', ['x', 'y', 'z']
+  else:
+    grid_geometry, axis_labels = 'cylindrical', ['r', 'theta', 'z']
+
+  g_size = index.max(axis = 0) + 1
+  chunks = (1, int(min(g_size[1], 64)), int(g_size[2])) if g_size[0] > 1 else True
+
+  h5 = h5py.File(h5_file, 'w')
+  h5.attrs['dataType'] = np.bytes_('Bmad:grid_field')
+  h5.attrs['openPMD'] = np.bytes_('2.0.0')
+  h5.attrs['openPMDextension'] = np.bytes_('BeamPhysics;SpeciesType')
+  h5.attrs['externalFieldPath'] = np.bytes_('/ExternalFieldMesh/%T/')
+  h5.attrs['software'] = np.bytes_('opera_fieldmap_to_bmad')
+  h5.attrs['softwareVersion'] = np.bytes_('1.0')
+  h5.attrs['date'] = np.bytes_(time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+  grid = h5.create_group('ExternalFieldMesh/1')
+  grid.attrs['gridGeometry'] = np.bytes_(grid_geometry)
+  grid.attrs['axisLabels'] = np.array(axis_labels, dtype = 'S')
+  grid.attrs['fieldScale'] = np.float64(1.0)
+  grid.attrs['componentFieldScale'] = np.float64(1.0)
+  grid.attrs['eleAnchorPt'] = np.bytes_('center')   # double check your field map, you may want to change this.
+  grid.attrs['gridOriginOffset'] = np.asarray(r0, dtype = np.float64)
+  grid.attrs['gridSpacing'] = np.asarray(dr, dtype = np.float64)
+  grid.attrs['harmonic'] = np.int32(0)
+  grid.attrs['interpolationOrder'] = np.int32(1)
+  grid.attrs['gridLowerBound'] = np.zeros(3, dtype = np.int32)
+  grid.attrs['gridSize'] = g_size.astype(np.int32)
+  grid.attrs['gridCurvatureRadius'] = np.float64(0.0)
+
+  b_grp = grid.create_group('magneticField')
+  ix, iy, iz = index[:,0], index[:,1], index[:,2]
+  for j, name in enumerate(axis_labels):
+    comp = np.zeros(tuple(g_size), dtype = np.complex128)   # h5py stores complex as an (r, i) compound
+    comp.real[ix, iy, iz] = field[:,j] * units
+    dset = b_grp.create_dataset(name, data = comp, chunks = chunks, compression = 'gzip', shuffle = True)
+    del comp
+    dset.attrs['gridDataOrder'] = np.bytes_('C')
+    dset.attrs['localName'] = np.bytes_(name)
+    dset.attrs['unitSI'] = np.float64(1.0)
+    dset.attrs['unitDimension'] = np.array([0, 1, -2, -1, 0, 0, 0], dtype = np.float64)  # Tesla
+    dset.attrs['unitSymbol'] = np.bytes_('T')
+
+  h5.close()
+
+  info = open(h5_file + '.info', 'w')
+  info.write('! Bmad grid_field stored in HDF5 file: ' + os.path.basename(h5_file) + '\n')
+  info.write('!   geometry = ' + geometry + ', field_type = magnetic, ele_anchor_pt = center\n')
+  info.write('!   r0 = (' + str(r0[0]) + ', ' + str(r0[1]) + ', ' + str(r0[2]) + ')\n')
+  info.write('!   dr = (' + str(dr[0]) + ', ' + str(dr[1]) + ', ' + str(dr[2]) + ')\n')
+  info.write('!   grid size = (' + str(g_size[0]) + ', ' + str(g_size[1]) + ', ' + str(g_size[2]) + ')\n')
+  info.write('! Use in an element definition with:\n')
+  info.write('!   grid_field = call::' + os.path.basename(h5_file) + '\n')
+  info.close()
+
+#########################################################################
+
+#Apply the crop, symmetry, decimate and resample options.
+
+def process_grid(arg, r0, dr, index, field):
+  geometry = 'xyz'
+  if arg.crop or arg.decimate or arg.resample or arg.symmetry:
+    grid = nodes_to_grid(index, field)
+    del index, field
+    if arg.crop: grid, r0 = crop_grid(grid, r0, dr, arg.crop[0::2], arg.crop[1::2])
+    if arg.symmetry == 'rz':
+      grid, r0, dr = fold_rz(grid, r0, dr)
+      geometry = 'rotationally_symmetric_rz'
+    if arg.decimate: grid, dr = decimate_grid(grid, dr, arg.decimate)
+    if arg.resample: grid, dr = resample_grid(grid, dr, arg.resample)
+    index, field = grid_to_nodes(grid)
+    print('Grid size after processing: ' + str(grid.shape[0:3]))
+
+  return r0, dr, index, field, geometry
+
+#########################################################################
+#Convert one opera table. Returns the name of the file written and the longitudinal extent of the grid (meters).
+#If table = (r0, dr, index, field) is given, the table has already been read.
+
+def convert_file(opera_file, arg, shared_grid = None, table = None):
+  bmad_parse = os.path.join(os.getcwd(),'bmad_parse_'+os.path.basename(opera_file))
+
+#########################################################################
+#Gauss (1e-4)or Tesla (1)
+  units = 1e-4
+
+  if table is None: table = read_opera_table(opera_file, shared_grid)
+  r0, dr, index, field, geometry = process_grid(arg, *table)
+
+  length = dr[2] * index[:,2].max()
+  if arg.hdf5:
+    write_hdf5_grid_field(bmad_parse + '.h5', r0, dr, index, field, units, geometry)
+    return bmad_parse + '.h5', length
+  else:
+    write_ascii_grid_field(bmad_parse, r0, dr, index, field, units, geometry)
+    return bmad_parse, length
+
+#########################################################################
+#Batch conversion worker. The shared grid and options are set once per worker process by init_worker.
+
+worker_state = {}
+
+def init_worker(arg, shared_grid):
+  worker_state['arg'] = arg
+  worker_state['shared_grid'] = shared_grid
+
+def convert_worker(opera_file):
+  return convert_file(opera_file, worker_state['arg'], worker_state['shared_grid'])
+
+#########################################################################
+#Write a Bmad file defining one element per Opera table, each calling the grid field file of its table.
+#A lattice can call this file and then use any of the elements. Element names are made from the table names.
+#The element length is the longitudinal extent of the grid and, since ele_anchor_pt = center, the grid is
+#centered in the element. Change the element type and add other parameters as needed.
+
+def write_element_include(include_file, out_files, lengths, opera_files):
+  inc = open(include_file, 'w')
+  inc.write('! Grid field elements written by opera_fieldmap_to_bmad. One element per Opera table.\n')
+  inc.write('! Use with: call, file = ' + os.path.basename(include_file) + '\n\n')
+
+  names = []
+  for out_file, length, opera_file in zip(out_files, lengths, opera_files):
+    name = re.sub(r'\W', '_', os.path.splitext(os.path.basename(opera_file))[0])
+    if not name[0].isalpha(): name = 'opera_' + name
+    base_name = name
+    n = 1
+    while name in names:
+      n += 1
+      name = base_name + '_' + str(n)
+    names.append(name)
+    inc.write('! From: ' + opera_file + '\n')
+    inc.write(name + ': em_field, l = ' + '%.10g' % length + ', field_calc = fieldmap, grid_field = call::' +
+              os.path.relpath(out_file, os.path.dirname(os.path.abspath(include_file))) + '\n')
+
+  inc.close()
+
+#########################################################################
+
+def main( argv ):
+  argp = argparse.ArgumentParser()
+  argp.add_argument('opera_file', help = 'Name of input Opera table file(s). Tables after the first are assumed to ' +
+                    'share the grid of the first (this is checked).', nargs = '+')
+  argp.add_argument('-H', '--hdf5', help = 'Write the grid field as a compressed HDF5 file instead of ASCII.', action = 'store_true')
+  argp.add_argument('-c', '--crop', help = 'Keep only nodes inside the box. Meters.', type = float, nargs = 6,
+                    metavar = ('X_MIN', 'X_MAX', 'Y_MIN', 'Y_MAX', 'Z_MIN', 'Z_MAX'))
+  argp.add_argument('-d', '--decimate', help = 'Keep every N-th node along each axis.', type = int, nargs = 3,
+                    metavar = ('NX', 'NY', 'NZ'))
+  argp.add_argument('-r', '--resample', help = 'Trilinear resample onto a grid with this spacing. Meters.', type = float, nargs = 3,
+                    metavar = ('DX', 'DY', 'DZ'))
+  argp.add_argument('-s', '--symmetry', help = 'Store only the unique part of a symmetric field. ' +
+                    'rz: Rotationally symmetric field written as a rotationally_symmetric_rz grid.', choices = ['rz'])
+  argp.add_argument('-j', '--jobs', help = 'Number of tables converted in parallel. Default: 1', type = int, default = 1)
+  argp.add_argument('-m', '--include', help = 'Also write this Bmad file defining one element per table that ' +
+                    'calls the grid field of the table.')
+  arg = argp.parse_args(argv)
+
+  opera_files = arg.opera_file
+
+  if len(opera_files) == 1:
+    out_files = [convert_file(opera_files[0], arg)]
+
+  else:
+    shared_grid, table = detect_grid(opera_files[0])
+    print('Shared grid from ' + opera_files[0] + ': r0 = ' + str(shared_grid[1]) + ', dr = ' + str(shared_grid[2]))
+    if arg.jobs > 1:
+      # The first table, already read, is converted here while the workers convert the others.
+      pool = Pool(max(1, min(arg.jobs - 1, len(opera_files) - 1)), initializer = init_worker, initargs = (arg, shared_grid))
+      result = pool.map_async(convert_worker, opera_files[1:], chunksize = 1)
+      out_files = [convert_file(opera_files[0], arg, table = table)] + result.get()
+      pool.close()
+      pool.join()
+    else:
+      out_files = [convert_file(opera_files[0], arg, table = table)] + \
+                  [convert_file(opera_file, arg, shared_grid) for opera_file in opera_files[1:]]
+
+  out_files, lengths = [out[0] for out in out_files], [out[1] for out in out_files]
+  for opera_file, out_file in zip(opera_files, out_files):
+    print(opera_file + ' -> ' + out_file)
+
+  if arg.include:
+    write_element_include(arg.include, out_files, lengths, opera_files)
+    print('Element definitions: ' + arg.include)
 
 
 def append_zero(i):
@@ -7,7 +7,7 @@
 # SXF lattice files can be constructed from MADX using the SXFWRITE command.
 #-
 
-import sys, re, math
+import sys, re, math, argparse
 import time
 
 
@@ -46,11 +46,7 @@ def param_to_string(param, ele):
   if param.name == 'arc' and ele.type == 'sbend': return ', l = ' + param.value
   if param.name == 'volt': return ', l = 1e6 * ' + param.value
 
-  length = 0
-  if ele.type in ['rbend', 'sbend'] and 'arc' in ele.param: 
-    length = float(ele.param['arc'].value)
-  elif 'l' in ele.param: 
-    length = float(ele.param['l'].value)
+  length = ele_length(ele)
 
   if param.name == 'kl':
     kl_arr = param.value
@@ -87,12 +83,34 @@ def param_to_string(param, ele):
 #------------------------------------------------------------------
 #------------------------------------------------------------------
 
-def print_help():
-  print (''' \
-Syntax: 
-  sxf_to_bmad.py <xsf_lattice_file>
-''')
-  sys.exit()
+def ele_params_to_string(ele):
+  line = ''
+  for name, param in ele.param.items():
+    if param.type == 'container':
+      for name2, param2 in param.value.items():
+        line = line + param_to_string(param2, ele)
+    else:
+      line = line + param_to_string(param, ele)
+  return line
+
+#------------------------------------------------------------------
+#------------------------------------------------------------------
+# Return the name of the drift with length gap. Drifts with equal lengths share a name.
+
+def drift_name(gap, drift_def):
+  l_str = '%.12g' % gap
+  if l_str not in drift_def: drift_def[l_str] = 'sxf_drift' + str(len(drift_def) + 1)
+  return drift_def[l_str]
+
+#------------------------------------------------------------------
+#------------------------------------------------------------------
+
+def ele_length(ele):
+  if ele.type in ['rbend', 'sbend'] and 'arc' in ele.param: 
+    return float(ele.param['arc'].value)
+  elif 'l' in ele.param: 
+    return float(ele.param['l'].value)
+  return 0.0
 
 #-------------------------------------------------------------------
 #------------------------------------------------------------------
@@ -150,14 +168,35 @@ def WrapWrite(f_out, line):
     tab = '         '
     line = line[ix+1:]
 
+#-------------------------------------------------------------------
+#------------------------------------------------------------------
+# Write a "name: line = (...)" statement. Done piecewise since WrapWrite is too slow for 
+# a line with tens of thousands of elements.
+
+def write_line_list(f_out, line_name, name_list):
+  MAXLEN = 120
+  line = line_name + ': line = ('
+
+  for ix, name in enumerate(name_list):
+    if ix < len(name_list) - 1: name = name + ', '
+    if len(line) + len(name) > MAXLEN:
+      f_out.write(line.rstrip() + '\n')
+      line = '  '
+    line = line + name
+
+  f_out.write(line + ')\n')
+
 #-------------------------------------------------------------------
 #------------------------------------------------------------------
 # Main program.
 
-if len(sys.argv) == 2:
-  sxf_lat_file = sys.argv[1]
-elif len(sys.argv) > 2:
-  print_help()
+argp = argparse.ArgumentParser()
+argp.add_argument('sxf_file', help = 'Name of input SXF lattice file')
+argp.add_argument('-l', '--line', help = 'Write the lattice as a line with explicit drifts instead of ' +
+                  'superimposing elements on a single drift. Much faster for Bmad to load.', action = 'store_true')
+arg = argp.parse_args()
+
+sxf_lat_file = arg.sxf_file
 
 f_in = open(sxf_lat_file, 'r')
 
@@ -299,27 +338,92 @@ elif sxf_lat_file.find('SXF') != -1:
 else:
   bmad_lat_file = sxf_lat_file + '.bmad'
 
-f_out = open(bmad_lat_file, 'w')
-f_out.write ('! Translated from SXF file: ' + sxf_lat_file + '\n\n')
+#-----------------------------------------------------------
+# Line output: Sort elements by position and fill the gaps with drifts.
+# The output file is only opened after the line has been built so an error does not leave a partial file.
+
+if arg.line:
+  DRIFT_TOL = 1e-9      # Gaps smaller than this are ignored.
+  OVERLAP_TOL = 1e-6    # Overlaps larger than this are an error.
+
+  ele_list = []   # List of [s_start, input_index, ele]
+  s_end = 0
+  for ix, ele in enumerate(seq.line):
+    length = ele_length(ele)
+    if 'at' in ele.param:
+      s_start = float(ele.param['at'].value) - 0.5 * length
+    else:
+      s_start = s_end
+    s_end = s_start + length
+    ele_list.append([s_start, ix, ele])
 
-f_out.write ('sequence_drift: drift, l = ' + seq.length + '\n')
-f_out.write ('machine: line = (sequence_drift)\n')
-f_out.write ('use, machine\n')
+  # Starts are rounded to OVERLAP_TOL so that elements whose starts only differ by round off (EG: a zero
+  # length multipole at the end of one element and the next element) keep their input order.
 
-for ele in seq.line:
-  line = ele.name + ': ' + ele.type
-  if 'at' in ele.param:
-    line = line + ', superimpose, offset = ' + ele.param['at'].value
-  else:
-    line = line + ', superimpose, ref = ' + old_ele.name + 'ref_origin = end, ele_origin = beginning'
+  ele_list.sort(key = lambda item: (round(item[0] / OVERLAP_TOL), item[1]))
 
-  for name, param in ele.param.items():
-    if param.type == 'container':
-      for name2, param2 in param.value.items():
-        line = line + param_to_string(param2, ele)
-    else:
-      line = line + param_to_string(param, ele)
+  # Element definitions. An element name used with differing parameters gets a unique name.
+
+  ele_def = dict()      # Element name -> definition line
+  drift_def = dict()    # Drift length string -> drift name
+  name_list = []
+  s_end = 0
+
+  for s_start, ix, ele in ele_list:
+    gap = s_start - s_end
+    if gap < -OVERLAP_TOL:
+      error_exit ('ELEMENT: ' + ele.name + ' OVERLAPS PREVIOUS ELEMENT BY: ' + str(-gap) + 
+                  '\nUSE THE DEFAULT SUPERPOSITION OUTPUT MODE FOR THIS LATTICE.')
+    if gap > DRIFT_TOL: name_list.append(drift_name(gap, drift_def))
+
+    line = ele.type + ele_params_to_string(ele)
+
+    ele_name = ele.name
+    n = 1
+    while ele_name in ele_def and ele_def[ele_name] != line:
+      n += 1
+      ele_name = ele.name + '_' + str(n)
+    ele_def[ele_name] = line
+
+    name_list.append(ele_name)
+    s_end = max(s_end, s_start + ele_length(ele))
+
+  gap = float(seq.length) - s_end
+  if gap > DRIFT_TOL: name_list.append(drift_name(gap, drift_def))
+
+  f_out = open(bmad_lat_file, 'w')
+  f_out.write ('! Translated from SXF file: ' + sxf_lat_file + '\n\n')
+
+  for l_str, name in drift_def.items():
+    f_out.write(name + ': drift, l = ' + l_str + '\n')
+
+  for name, line in ele_def.items():
+    f_out.write('\n')
+    WrapWrite(f_out, name + ': ' + line)
 
   f_out.write('\n')
-  WrapWrite(f_out, line)
-  old_ele = ele
+  write_line_list(f_out, 'machine', name_list)
+  f_out.write('use, machine\n')
+
+#-----------------------------------------------------------
+# Superposition output
+
+else:
+  f_out = open(bmad_lat_file, 'w')
+  f_out.write ('! Translated from SXF file: ' + sxf_lat_file + '\n\n')
+  f_out.write ('sequence_drift: drift, l = ' + seq.length + '\n')
+  f_out.write ('machine: line = (sequence_drift)\n')
+  f_out.write ('use, machine\n')
+
+  for ele in seq.line:
+    line = ele.name + ': ' + ele.type
+    if 'at' in ele.param:
+      line = line + ', superimpose, offset = ' + ele.param['at'].value
+    else:
+      line = line + ', superimpose, ref = ' + old_ele.name + 'ref_origin = end, ele_origin = beginning'
+
+    line = line + ele_params_to_string(ele)
+
+    f_out.write('\n')
+    WrapWrite(f_out, line)
+    old_ele = ele